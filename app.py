@@ -1,24 +1,253 @@
 import defusedxml.ElementTree as ET
+import numpy as np
 import pandas as pd
 from datetime import datetime
 import os
+import hashlib
+import json
 import requests
 import io
+import logging
+import marshal
+import mmap
+import multiprocessing
+import pickle
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from urllib.parse import urlparse
 import ipaddress
 
-from flask import Flask, render_template, request, send_file, session
+from flask import Flask, Response, jsonify, redirect, render_template, request, send_file, session, url_for
 from config import Config
+from compression import DecompressedSizeError, DecompressionError, LimitedReader, estimated_size, is_compressed, open_feed
+from feed_cache import FeedCache
+from feed_parser import iter_products, parse_file_shard, parse_shard, products_from_element
+from jobs import JobManager
+from metrics import JobRun, Metrics, in_job, peak_rss
+from product_store import ProductStore
+from external_sort import iter_sorted_products, merge_join, write_sorted_runs
+from exporters import InMemoryMultiResult, InMemoryResult, difference_record, error_record, header_record, iter_csv, iter_ndjson, iter_ndjson_records, multi_csv_zip, only_in_record, parquet_file, summary_record, xlsx_file
+from scheduler import ComparisonScheduler, load_scheduled_pairs
+from results_store import SORT_COLUMNS, StoredMultiResult, StoredResult, load_summary, query_differences, save_multi_results, save_results, target_result_path
+
+# Cache pobranych feedów na dysku, współdzielony przez workery gunicorna (0 = wyłączony)
+feed_cache = FeedCache(Config.FEED_CACHE_DIR, Config.FEED_CACHE_MAX_SIZE, Config.FEED_CACHE_TTL) if Config.FEED_CACHE_MAX_SIZE > 0 else None
+
+# Logi etapów i próbkowane logi per produkt (LOG_LEVEL=DEBUG)
+logging.basicConfig(level=Config.LOG_LEVEL, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+logger = logging.getLogger('feedcompare')
+
+# Czasy etapów i liczniki dla /metrics, współdzielone przez workery przez METRICS_DIR
+metrics = Metrics(Config.METRICS_DIR)
+
+# Wspólna sesja HTTP - połączenia są utrzymywane w puli i używane ponownie
+http_session = requests.Session()
+# Feedy przesyłane jako gzip - treść trafia do cache skompresowana i jest rozpakowywana strumieniowo przy parsowaniu
+http_session.headers['Accept-Encoding'] = 'gzip'
+
+# Content-Encoding, przy których bajty odpowiedzi zapisujemy bez dekodowania (rozpakowanie po sygnaturze)
+RAW_CONTENT_ENCODINGS = ('', 'identity', 'gzip', 'x-gzip')
+
+# Co ile produktów raportowany jest postęp porównania
+PROGRESS_EVERY = 1000
+
+# Liczba wierszy macierzy różnic N-way pokazywanych na stronie wyników (całość w eksportach)
+MATRIX_PREVIEW_ROWS = 200
+
+# Liczba produktów porównywanych naraz przez silnik 'pandas'
+VECTOR_CHUNK_SIZE = 100000
+
+# Początek elementu produktu (z opcjonalnym prefiksem namespace) - granica podziału feedu na shardy
+PRODUCT_START_RE = re.compile(rb'<((?:[\w.-]+:)?(?:item|product|entry|offer))[\s/>]', re.IGNORECASE)
+
+# Pula procesów do równoległego parsowania (PARSE_WORKERS > 0), tworzona przy pierwszym użyciu
+parse_pool = None
+parse_pool_lock = threading.Lock()
+
+# Pobrania do tego rozmiaru trzymane są w pamięci, większe trafiają do pliku tymczasowego
+SPOOL_MEMORY_LIMIT = 32 * 1024 * 1024
+
+def product_fingerprint(product_data):
+    """
+    Skrót rekordu produktu (nazwy i wartości atrybutów w kolejności z feedu), stabilny
+    między procesami. marshal w wersji 2 nie zapisuje referencji do współdzielonych
+    obiektów, więc internowane wartości ProductStore dają te same bajty co zwykły dict.
+    """
+    return hashlib.blake2b(marshal.dumps((tuple(product_data), tuple(product_data.values())), 2), digest_size=16).digest()
+
+def content_size(content):
+    """Rozmiar pobranej treści feedu (bytes, mmap albo plik tymczasowy) w bajtach"""
+    if hasattr(content, '__len__'):
+        return len(content)
+    position = content.tell()
+    size = content.seek(0, os.SEEK_END)
+    content.seek(position)
+    return size
+
+def feed_size(content):
+    """
+    Rozmiar XML feedu w bajtach do wyboru trybu porównania: dla treści skompresowanej
+    (gzip, bz2, zstd) szacowany bez rozpakowywania (compression.estimated_size)
+    """
+    size = estimated_size(content)
+    return content_size(content) if size is None else size
+
+def response_chunks(response):
+    """
+    Bajty odpowiedzi HTTP w porcjach DOWNLOAD_CHUNK_SIZE. Odpowiedź z Content-Encoding gzip
+    nie jest dekodowana - skompresowaną treść rozpozna i rozpakuje parser.
+    """
+    if response.headers.get('content-encoding', '').lower() in RAW_CONTENT_ENCODINGS:
+        return response.raw.stream(Config.DOWNLOAD_CHUNK_SIZE, decode_content=False)
+    return response.iter_content(chunk_size=Config.DOWNLOAD_CHUNK_SIZE)
+
+def product_map(items=()):
+    """Nowa mapa produktów: kompaktowy ProductStore albo zwykły dict (COMPACT_PRODUCT_STORE=False)"""
+    return ProductStore(items) if Config.COMPACT_PRODUCT_STORE else dict(items)
+
+def get_parse_pool():
+    """
+    Pula procesów parsowania. Procesy startuje forkserver, a nie fork - fork procesu
+    z wieloma wątkami (gunicorn, pule wątków pobierania) może zakleszczyć proces
+    potomny na blokadzie przejętej w chwili forka.
+    """
+    global parse_pool
+    with parse_pool_lock:
+        if parse_pool is None:
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload(['feed_parser'])
+            parse_pool = ProcessPoolExecutor(max_workers=Config.PARSE_WORKERS, mp_context=context)
+        return parse_pool
+
+def discard_parse_pool(pool):
+    """Usuwa uszkodzoną pulę (proces potomny zakończył się nagle) - następne użycie tworzy nową"""
+    global parse_pool
+    with parse_pool_lock:
+        if parse_pool is pool:
+            parse_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def feed_buffer(content):
+    """Treść feedu jako bufor z dostępem swobodnym (bytes albo mmap) - plik tymczasowy jest mapowany"""
+    if isinstance(content, (bytes, bytearray, mmap.mmap)):
+        return content
+    try:
+        return mmap.mmap(content.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        return b''
+
+def split_feed(data, shard_size):
+    """
+    Dzieli feed na shardy w miejscach, gdzie zaczyna się element produktu najwyższego
+    poziomu. Każdy shard to samodzielny dokument: nagłówek (wszystko przed pierwszym
+    produktem) + zakres bajtów + zakończenie (wszystko po ostatnim produkcie), opisany
+    listą zakresów (offset, długość) - treść shardu powstaje dopiero przy parsowaniu.
+    Gdy feedu nie da się tak podzielić, zwraca jeden shard z całym feedem.
+
+    Granica w złym miejscu (w CDATA, komentarzu albo wewnątrz produktu o tym samym
+    tagu) zostawia niezamknięty element w jednym z shardów, więc parsowanie takiego
+    shardu kończy się błędem - nigdy po cichu innym wynikiem.
+    """
+    whole = [[(0, len(data))]]
+    first = PRODUCT_START_RE.search(data)
+    if first is None or len(data) <= shard_size:
+        return whole
+    tag = first.group(1)
+    end_tag = b'</' + tag + b'>'
+    last_end = data.rfind(end_tag)
+    if last_end < first.start():
+        return whole
+    last_end += len(end_tag)
+
+    start_re = re.compile(b'<' + re.escape(tag) + rb'[\s/>]')
+    header = (0, first.start())
+    footer = (last_end, len(data) - last_end)
+    if PRODUCT_START_RE.search(data, last_end):
+        # Ostatni produkt jest pustym elementem (<item/>) albo po ostatnim produkcie są
+        # produkty o innym tagu - zakończenie trafiłoby do każdego shardu i zmieniło
+        # kolejność produktów względem parsowania szeregowego
+        return whole
+
+    shards = []
+    start = first.start()
+    while start < last_end:
+        boundary = start_re.search(data, start + shard_size, last_end)
+        end = boundary.start() if boundary else last_end
+        shards.append([header, (start, end - start), footer])
+        start = end
+    return shards
+
+def shard_bytes(data, ranges):
+    """Treść shardu (lista zakresów (offset, długość) z split_feed) jako bytes"""
+    if isinstance(data, bytes) and ranges == [(0, len(data))]:
+        return data
+    return b''.join(data[offset:offset + length] for offset, length in ranges)
+
+def feed_path(content):
+    """Ścieżka pliku z treścią feedu (blob z cache albo nazwany plik tymczasowy) albo None"""
+    path = getattr(content, 'path', None) or getattr(content, 'name', None)
+    return path if isinstance(path, str) and os.path.isfile(path) else None
+
+def map_bounded(pool, tasks, limit):
+    """
+    Jak pool.map dla zadań (funkcja, *argumenty), ale zleca najwyżej limit zadań naraz:
+    zadania (i treść shardów) powstają dopiero przy zlecaniu, więc w pamięci procesu
+    jest najwyżej limit shardów. Zwraca wyniki w kolejności zadań; po błędzie anuluje
+    zadania jeszcze nieuruchomione.
+    """
+    pending = deque()
+    try:
+        for fn, *args in tasks:
+            if len(pending) >= limit:
+                yield pending.popleft().result()
+            pending.append(pool.submit(fn, *args))
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+class CountingReader:
+    """Strumień tylko do odczytu, który liczy przeczytane bajty (do szacowania liczby produktów)"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.bytes_read += len(data)
+        return data
 
 # --- Klasa XMLFeedComparator (bez zmian) ---
 class XMLFeedComparator:
     # ... (cała klasa pozostaje identyczna jak wcześniej) ...
+    # Wersja formatu wyniku parsera - zmiana unieważnia zapisane snapshoty
+    PARSER_VERSION = 1
+    # Wersja odcisków produktów (porównanie przyrostowe) - zmiana unieważnia zapisane odciski i stany
+    FINGERPRINT_VERSION = 2
+
     def __init__(self, source1, source2):
         self.source1 = source1
         self.source2 = source2
         self.feed1_data = {}
         self.feed2_data = {}
         self.last_error = None
+        # Odciski produktów feedów (numer feedu -> {product_id: skrót}) liczone przy parsowaniu
+        self.fingerprints = {}
+        # Opcjonalny callback postępu: progress_callback(etap, przetworzone, wszystkie)
+        self.progress_callback = None
+        self.logged_products = 0   # licznik produktów z różnicami dla próbkowanego logowania
+
+    def _report_progress(self, stage, done=None, total=None):
+        if self.progress_callback:
+            self.progress_callback(stage, done, total)
 
     def _validate_url(self, url):
         """
@@ -71,111 +300,416 @@ class XMLFeedComparator:
         except Exception as e:
             return False, f"URL validation error: {str(e)}"
 
+    def _check_source(self, source):
+        """
+        Walidacja źródła feedu wspólna dla _fetch_content i sniff_feed.
+        Zwraca krotkę (is_url, komunikat_błędu): URL musi przejść _validate_url,
+        a plik lokalny musi istnieć i mieścić się w MAX_XML_SIZE.
+        """
+        if source.startswith('http://') or source.startswith('https://'):
+            with metrics.stage('validate'):
+                is_valid, error_msg = self._validate_url(source)
+            if not is_valid:
+                print(f"URL validation failed: {error_msg}")
+                return True, f"Błąd walidacji URL: {error_msg}"
+            return True, None
+        if os.path.exists(source):
+            return False, self._size_error(os.path.getsize(source))
+        return False, f"Nieprawidłowy URL lub plik nie istnieje: {source}"
+
+    def _size_error(self, size):
+        """Komunikat, gdy rozmiar feedu (plik lub Content-Length) przekracza MAX_XML_SIZE; None gdy mieści się w limicie"""
+        if size and int(size) > Config.MAX_XML_SIZE:
+            print(f"XML file too large: {size} bytes (max: {Config.MAX_XML_SIZE})")
+            return f"Plik XML jest za duży ({size} bajtów). Maksymalny rozmiar: {Config.MAX_XML_SIZE} bajtów."
+        return None
+
+    def _cache_lookup(self, source):
+        """Wpis cache dla URL albo None - wpisy większe niż MAX_XML_SIZE są pomijane"""
+        cache_entry = feed_cache.lookup(source) if feed_cache else None
+        if cache_entry and cache_entry['size'] > Config.MAX_XML_SIZE:
+            return None
+        return cache_entry
+
     def _get_xml_content(self, source):
+        """
+        Pobiera treść feedu z URL lub pliku lokalnego.
+        Zwraca krotkę (content, error_message) - content to bytes, mmap z cache
+        albo plik tymczasowy ustawiony na początek; przy błędzie content jest None.
+        Nie modyfikuje stanu obiektu, więc może działać równolegle dla obu feedów.
+        """
+        with metrics.stage('download', source=source) as info:
+            content, error = self._fetch_content(source)
+            if content is not None:
+                info['bytes'] = content_size(content)
+        return content, error
+
+    def _fetch_content(self, source):
         try:
-            if source.startswith('http://') or source.startswith('https://'):
-                # Validate URL first
-                is_valid, error_msg = self._validate_url(source)
-                if not is_valid:
-                    print(f"URL validation failed: {error_msg}")
-                    self.last_error = f"Błąd walidacji URL: {error_msg}"
-                    return None
-                
-                # Fetch XML with configured timeout
-                response = requests.get(
+            # Validate URL / file size first
+            is_url, error = self._check_source(source)
+            if error:
+                return None, error
+            if is_url:
+                # Feed z cache: świeży wpis zwracamy od razu, starszy rewalidujemy warunkowym GET
+                cache_entry = self._cache_lookup(source)
+                if cache_entry and feed_cache.is_fresh(cache_entry):
+                    content = feed_cache.open(cache_entry)
+                    if content is not None:
+                        metrics.inc('feedcompare_cache_requests_total', cache='feed', result='hit')
+                        return content, None
+                    # Plik usunięty z cache przez inny worker - pobieramy feed ponownie
+                    cache_entry = None
+
+                # Fetch XML with configured timeout (pooled connections)
+                response = http_session.get(
                     source, 
                     timeout=Config.REQUEST_TIMEOUT,
-                    stream=True  # Stream to check size before loading
+                    stream=True,  # Stream to check size before loading
+                    headers=feed_cache.conditional_headers(cache_entry) if cache_entry else None
                 )
+                if cache_entry and response.status_code == 304:
+                    response.close()
+                    content = feed_cache.open(feed_cache.revalidated(source, cache_entry))
+                    if content is not None:
+                        metrics.inc('feedcompare_cache_requests_total', cache='feed', result='revalidated')
+                        return content, None
+                    # Plik usunięty z cache po zapytaniu warunkowym - pobieramy całość bez warunków
+                    response = http_session.get(source, timeout=Config.REQUEST_TIMEOUT, stream=True)
                 response.raise_for_status()
                 
                 # Check content size
-                content_length = response.headers.get('content-length')
-                if content_length and int(content_length) > Config.MAX_XML_SIZE:
-                    print(f"XML file too large: {content_length} bytes (max: {Config.MAX_XML_SIZE})")
-                    self.last_error = f"Plik XML jest za duży ({content_length} bajtów). Maksymalny rozmiar: {Config.MAX_XML_SIZE} bajtów."
-                    return None
+                error = self._size_error(response.headers.get('content-length'))
+                if error:
+                    response.close()
+                    return None, error
                 
-                # Read content with size limit
-                content = b''
-                for chunk in response.iter_content(chunk_size=8192):
-                    content += chunk
-                    if len(content) > Config.MAX_XML_SIZE:
+                size_exceeded_error = f"Plik XML przekroczył limit rozmiaru podczas pobierania. Maksymalny rozmiar: {Config.MAX_XML_SIZE} bajtów."
+                chunks = response_chunks(response)
+                if feed_cache:
+                    metrics.inc('feedcompare_cache_requests_total', cache='feed', result='miss')
+                    cache_entry = feed_cache.store(
+                        source,
+                        chunks,
+                        Config.MAX_XML_SIZE,
+                        etag=response.headers.get('ETag'),
+                        last_modified=response.headers.get('Last-Modified')
+                    )
+                    if cache_entry is None:
+                        print(f"XML file exceeded size limit during download")
+                        response.close()
+                        return None, size_exceeded_error
+                    content = feed_cache.open(cache_entry)
+                    if content is None:
+                        return None, "Pobrany plik XML został usunięty z cache przed odczytem. Spróbuj ponownie."
+                    return content, None
+
+                # Read content with size limit (małe pliki w pamięci, duże na dysku)
+                content = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_LIMIT)
+                size = 0
+                for chunk in chunks:
+                    size += len(chunk)
+                    if size > Config.MAX_XML_SIZE:
                         print(f"XML file exceeded size limit during download")
-                        self.last_error = f"Plik XML przekroczył limit rozmiaru podczas pobierania. Maksymalny rozmiar: {Config.MAX_XML_SIZE} bajtów."
-                        return None
+                        response.close()
+                        content.close()
+                        return None, size_exceeded_error
+                    content.write(chunk)
                 
-                return content
-            elif os.path.exists(source):
-                # Check file size before reading
-                file_size = os.path.getsize(source)
-                if file_size > Config.MAX_XML_SIZE:
-                    print(f"XML file too large: {file_size} bytes (max: {Config.MAX_XML_SIZE})")
-                    self.last_error = f"Plik XML jest za duży ({file_size} bajtów). Maksymalny rozmiar: {Config.MAX_XML_SIZE} bajtów."
-                    return None
-                    
-                with open(source, 'rb') as f:
-                    return f.read()
-            else:
-                self.last_error = f"Nieprawidłowy URL lub plik nie istnieje: {source}"
-                return None
-        except requests.exceptions.Timeout:
+                content.seek(0)
+                return content, None
+
+            with open(source, 'rb') as f:
+                return f.read(), None
+        except Exception as e:
+            return None, self._download_error(source, e)
+
+    def _download_error(self, source, e):
+        """Komunikat dla użytkownika dla wyjątku zgłoszonego podczas pobierania feedu"""
+        if isinstance(e, requests.exceptions.Timeout):
             print(f"Timeout podczas pobierania: {source}")
-            self.last_error = f"Przekroczono czas oczekiwania na odpowiedź serwera (timeout: {Config.REQUEST_TIMEOUT}s)"
-            return None
-        except requests.exceptions.ConnectionError:
+            return f"Przekroczono czas oczekiwania na odpowiedź serwera (timeout: {Config.REQUEST_TIMEOUT}s)"
+        if isinstance(e, requests.exceptions.ConnectionError):
             print(f"Błąd połączenia: {source}")
-            self.last_error = "Nie można nawiązać połączenia z serwerem. Sprawdź URL i połączenie internetowe."
-            return None
-        except requests.exceptions.HTTPError as e:
+            return "Nie można nawiązać połączenia z serwerem. Sprawdź URL i połączenie internetowe."
+        if isinstance(e, requests.exceptions.HTTPError):
             print(f"Błąd HTTP: {e}")
-            self.last_error = f"Błąd HTTP: {e.response.status_code} - {e.response.reason}"
-            return None
-        except requests.exceptions.RequestException as e:
+            return f"Błąd HTTP: {e.response.status_code} - {e.response.reason}"
+        if isinstance(e, requests.exceptions.RequestException):
             print(f"Błąd sieciowy: {e}")
-            self.last_error = f"Błąd podczas pobierania pliku: {str(e)}"
-            return None
+            return f"Błąd podczas pobierania pliku: {str(e)}"
+        print(f"Nieoczekiwany błąd: {e}")
+        return f"Nieoczekiwany błąd: {str(e)}"
+
+    def _decompression_error(self, e):
+        """Komunikat dla użytkownika, gdy skompresowanego feedu nie da się rozpakować"""
+        print(f"Błąd rozpakowywania: {e}")
+        if isinstance(e, DecompressedSizeError):
+            return f"Plik XML po rozpakowaniu przekroczył limit rozmiaru. Maksymalny rozmiar: {Config.MAX_DECOMPRESSED_SIZE} bajtów."
+        return f"Nie udało się rozpakować pliku: {str(e)}"
+
+    def sniff_feed(self, source):
+        """
+        Szybki podgląd feedu dla /analyze: czyta strumieniowo tylko początek feedu
+        i przerywa pobieranie po SNIFF_PRODUCTS produktach. Zwraca krotkę
+        (atrybuty, liczba_produktów, oszacowanie, komunikat_błędu), gdzie oszacowanie to
+        None (cały feed przeczytany - liczba dokładna), 'approx' (liczba ekstrapolowana
+        z rozmiaru feedu) albo 'at_least' (rozmiar nieznany - liczba próbki).
+        """
+        try:
+            is_url, error = self._check_source(source)
+            if error:
+                return None, None, None, error
+            if is_url:
+                cache_entry = self._cache_lookup(source)
+                if cache_entry and feed_cache.is_fresh(cache_entry):
+                    content = feed_cache.open(cache_entry)
+                    # None: plik usunięty z cache przez inny worker - czytamy feed z serwera
+                    if content is not None:
+                        return self._sniff_stream(io.BytesIO(content) if isinstance(content, bytes) else content, len(content))
+
+                response = http_session.get(source, timeout=Config.REQUEST_TIMEOUT, stream=True)
+                try:
+                    response.raise_for_status()
+                    content_length = response.headers.get('content-length')
+                    error = self._size_error(content_length)
+                    if error:
+                        return None, None, None, error
+                    # Odpowiedź gzip czytamy skompresowaną (rozpakowuje ją parser), więc Content-Length
+                    # odpowiada liczbie czytanych bajtów; przy innych kodowaniach dekoduje urllib3
+                    raw = response.headers.get('content-encoding', '').lower() in RAW_CONTENT_ENCODINGS
+                    total_size = int(content_length) if content_length and raw else None
+                    response.raw.decode_content = not raw
+                    return self._sniff_stream(response.raw, total_size)
+                finally:
+                    # Zamknięcie połączenia przerywa pobieranie reszty feedu
+                    response.close()
+
+            with open(source, 'rb') as f:
+                return self._sniff_stream(f, os.path.getsize(source))
         except Exception as e:
-            print(f"Nieoczekiwany błąd: {e}")
-            self.last_error = f"Nieoczekiwany błąd: {str(e)}"
-            return None
+            return None, None, None, self._download_error(source, e)
+
+    def _sniff_stream(self, stream, total_size):
+        """
+        Zbiera atrybuty pierwszych SNIFF_PRODUCTS produktów ze strumienia i szacuje liczbę
+        produktów. total_size to rozmiar strumienia (przed rozpakowaniem) albo None.
+        Szacunek opiera się na pozycji w rozpakowanym XML - skompresowany strumień jest
+        czytany z wyprzedzeniem, więc liczba jego przeczytanych bajtów zawyża próbkę.
+        """
+        attributes = set()
+        count = 0
+        sampled_bytes = None
+        try:
+            opened = open_feed(stream, Config.MAX_DECOMPRESSED_SIZE)
+            if isinstance(opened, LimitedReader):
+                # Rozmiar po rozpakowaniu da się oszacować tylko dla pliku z dostępem swobodnym
+                seekable = isinstance(stream, mmap.mmap) or getattr(stream, 'seekable', lambda: False)()
+                total_size = estimated_size(stream) if total_size and seekable else None
+            reader = CountingReader(opened)
+            for _, product_data in self.iter_products(reader):
+                # Po osiągnięciu limitu dokończ produkty z już przeczytanego fragmentu -
+                # wtedy liczba produktów odpowiada liczbie przeczytanych bajtów
+                if sampled_bytes is not None and reader.bytes_read != sampled_bytes:
+                    break
+                attributes.update(product_data)
+                count += 1
+                if count == Config.SNIFF_PRODUCTS:
+                    sampled_bytes = reader.bytes_read
+            else:
+                return attributes, count, None, None
+        except ET.ParseError as e:
+            print(f"Błąd parsowania: {str(e)}")
+            return set(), 0, None, None
+        except DecompressionError as e:
+            return None, None, None, self._decompression_error(e)
+
+        if total_size:
+            return attributes, max(count, round(count * total_size / sampled_bytes)), 'approx', None
+        return attributes, count, 'at_least', None
 
     def parse_xml_feed(self, xml_content):
+        products, error = self._parse_feed(xml_content)
+        if error:
+            self.last_error = error
+        return products
+
+    def _parse_feed(self, xml_content):
+        """
+        Parsuje treść feedu bez zapisu do last_error (bezpieczne w wątkach).
+        Zwraca krotkę (produkty, komunikat_błędu); przy błędzie produkty to {}.
+        """
         try:
-            root = ET.fromstring(xml_content)
-            products = {}
-            for item in root.iter():
-                item_tag = item.tag.split('}', 1)[-1]
-                if item_tag.lower() in ['item', 'product', 'entry', 'offer']:
-                    product_data = {}
-                    product_id = None
-                    for child in item:
-                        child_tag = child.tag.split('}', 1)[-1]
-                        value = child.text.strip() if child.text else ''
-                        if child_tag.lower() in ['id', 'product_id', 'sku', 'g:id']:
-                            product_id = value
-                        product_data[child_tag] = value
-                    if product_id:
-                        products[product_id] = product_data
-            return products
+            if Config.PARSE_WORKERS > 0 and Config.STREAMING_PARSE:
+                return self._parse_parallel(xml_content), None
+            if Config.STREAMING_PARSE:
+                return product_map(self.iter_products(xml_content)), None
+            xml_content = open_feed(xml_content, Config.MAX_DECOMPRESSED_SIZE)
+            if hasattr(xml_content, 'read'):
+                root = ET.parse(xml_content).getroot()
+            else:
+                root = ET.fromstring(xml_content)
+            return product_map(products_from_element(root)), None
+        except DecompressionError as e:
+            return {}, self._decompression_error(e)
         except Exception as e:
             print(f"Błąd parsowania: {str(e)}")
-            return {}
-    
+            return {}, None
+
+    def _parse_parallel(self, xml_content):
+        """
+        Parsuje feed w puli procesów: feedy większe niż PARSE_SHARD_SIZE są dzielone
+        na shardy parsowane równolegle, a słowniki produktów łączone w kolejności
+        shardów - przy powtórzonym ID wygrywa ostatnie wystąpienie, jak przy
+        parsowaniu szeregowym. Gdy któryś shard nie da się sparsować, przekazać do
+        puli albo proces puli zakończy się nagle, feed jest parsowany szeregowo.
+
+        Feed zapisany w pliku (blob z cache, rozpakowany plik tymczasowy) trafia do puli
+        jako ścieżka i zakresy bajtów - procesy puli czytają shardy z pliku, bez kopii
+        w tym procesie. Shardy feedu w pamięci są kopiowane dopiero przy zlecaniu,
+        najwyżej 2 × PARSE_WORKERS naraz; pojedynczy shard zmapowanego pliku bez
+        ścieżki jest parsowany w tym procesie, bo przesłanie wymagałoby kopii całego
+        feedu. Skompresowany feed jest najpierw rozpakowywany do pliku tymczasowego,
+        bo podział na shardy wymaga dostępu swobodnego.
+        """
+        if is_compressed(xml_content):
+            with tempfile.NamedTemporaryFile(prefix='feedcompare-', dir=Config.EXTERNAL_SORT_DIR) as decompressed:
+                shutil.copyfileobj(open_feed(xml_content, Config.MAX_DECOMPRESSED_SIZE), decompressed, Config.DOWNLOAD_CHUNK_SIZE)
+                decompressed.flush()
+                return self._parse_parallel(decompressed)
+        data = feed_buffer(xml_content)
+        path = feed_path(xml_content)
+        shards = split_feed(data, Config.PARSE_SHARD_SIZE)
+        if path is not None:
+            tasks = ((parse_file_shard, path, ranges) for ranges in shards)
+        elif len(shards) > 1 or isinstance(data, bytes):
+            tasks = ((parse_shard, shard_bytes(data, ranges)) for ranges in shards)
+        else:
+            tasks = None
+
+        if tasks is not None:
+            products = product_map()
+            pool = get_parse_pool()
+            try:
+                for shard_products in map_bounded(pool, tasks, 2 * Config.PARSE_WORKERS):
+                    products.update(shard_products)
+            except BrokenProcessPool:
+                discard_parse_pool(pool)
+                print("   Pula procesów parsowania przestała działać - parsowanie szeregowe")
+            except ET.ParseError:
+                if len(shards) == 1:
+                    raise
+                print(f"   Nie udało się sparsować feedu w {len(shards)} shardach - parsowanie szeregowe")
+            except (OSError, TypeError, pickle.PicklingError) as e:
+                print(f"   Nie udało się przekazać feedu do puli procesów ({e}) - parsowanie szeregowe")
+            else:
+                return products
+        if isinstance(data, mmap.mmap):
+            data.seek(0)
+        return product_map(self.iter_products(data))
+
+    def iter_products(self, xml_content, backend=None):
+        """Strumieniowo zwraca pary (product_id, atrybuty) - feed_parser.iter_products"""
+        return iter_products(xml_content, backend)
+
+    def _load_feed(self, source, feed=None):
+        """
+        Pobiera i parsuje feed. Zwraca krotkę (produkty, komunikat_błędu);
+        przy błędzie pobierania produkty to None, przy błędzie rozpakowania {}.
+        feed - jak w _parse_content.
+        """
+        content, error = self._get_xml_content(source)
+        if content is None:
+            return None, error
+        return self._parse_content(content, feed)
+
+    def _parse_content(self, content, feed=None):
+        """
+        Parsuje pobraną treść feedu. Gdy cache jest włączony, sparsowane produkty są
+        zapisywane jako snapshot (klucz: skrót treści + wersja parsera) i przy
+        kolejnym użyciu tych samych bajtów wczytywane zamiast ponownego parsowania.
+        Przy INCREMENTAL_COMPARE i podanym numerze feedu odciski produktów trafiają do
+        self.fingerprints[feed] - liczone raz na treść feedu i zapisywane obok snapshotu.
+        Zwraca krotkę (produkty, komunikat_błędu) - jak _parse_feed.
+        """
+        content_hash = None
+        error = None
+        with metrics.stage('parse') as info:
+            if feed_cache is None:
+                products, error = self._parse_feed(content)
+            else:
+                content_hash = hashlib.sha256(content).hexdigest()
+                snapshot_key = f"{content_hash}-v{self.PARSER_VERSION}"
+                products = feed_cache.load_snapshot(
+                    snapshot_key, ProductStore.from_columns if Config.COMPACT_PRODUCT_STORE else None
+                )
+                metrics.inc('feedcompare_cache_requests_total', cache='snapshot', result='miss' if products is None else 'hit')
+                info['snapshot'] = products is not None
+                if products is None:
+                    products, error = self._parse_feed(content)
+                    if products:
+                        feed_cache.store_snapshot(snapshot_key, products)
+            info['products'] = len(products)
+
+        if feed is not None and Config.INCREMENTAL_COMPARE and content_hash and products:
+            with metrics.stage('fingerprint') as info:
+                fingerprints_key = f"{content_hash}-v{self.PARSER_VERSION}-f{self.FINGERPRINT_VERSION}"
+                fingerprints = feed_cache.load_fingerprints(fingerprints_key)
+                info['cached'] = fingerprints is not None
+                if fingerprints is None:
+                    fingerprints = {product_id: product_fingerprint(product_data) for product_id, product_data in products.items()}
+                    feed_cache.store_fingerprints(fingerprints_key, fingerprints)
+            self.fingerprints[feed] = fingerprints
+        return products, error
+
+    def _fetch_feeds(self):
+        """
+        Pobiera treść obu feedów równolegle, bez parsowania.
+        Zwraca listę [treść1, treść2] albo None (komunikat błędu w last_error).
+        """
+        self._report_progress('download')
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            fetched = list(executor.map(in_job(self._get_xml_content), [self.source1, self.source2]))
+        for content, error in fetched:
+            if content is None:
+                self.last_error = error
+                return None
+        return [content for content, _ in fetched]
+
+    def _load_feeds(self, contents=None):
+        """
+        Pobiera i parsuje oba feedy równolegle (czas pobierania to maksimum, a nie suma).
+        contents pozwala przekazać treści pobrane wcześniej przez _fetch_feeds.
+        Ustawia feed1_data/feed2_data; przy błędzie pobierania lub rozpakowania zwraca
+        numer feedu (1 lub 2) i zapisuje jego komunikat w last_error, w przeciwnym
+        razie zwraca None. Wątki nie zapisują last_error - błędy zbierane są z wyników
+        w kolejności feedów, żeby komunikat zawsze dotyczył właściwego feedu.
+        """
+        self._report_progress('download')
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            if contents is None:
+                loaded = list(executor.map(in_job(self._load_feed), [self.source1, self.source2], [1, 2]))
+            else:
+                loaded = list(executor.map(in_job(self._parse_content), contents, [1, 2]))
+        (self.feed1_data, _), (self.feed2_data, _) = loaded
+        for feed, (products, error) in enumerate(loaded, start=1):
+            if products is None or error:
+                self.last_error = error
+                return feed
+        return None
+
     def get_all_attributes(self):
         """Pobiera wszystkie unikalne atrybuty z pierwszego produktu każdego feeda"""
-        content1 = self._get_xml_content(self.source1)
-        if content1 is None:
+        if Config.SNIFF_PRODUCTS > 0:
+            return self._sniff_attributes()
+
+        failed_feed = self._load_feeds()
+        if failed_feed == 1:
             error_msg = f"Pierwszy plik XML - {self.last_error}" if self.last_error else "Nie udało się pobrać pierwszego pliku XML. Sprawdź URL i dostępność pliku."
             return None, error_msg
-            
-        content2 = self._get_xml_content(self.source2)
-        if content2 is None:
+        if failed_feed == 2:
             error_msg = f"Drugi plik XML - {self.last_error}" if self.last_error else "Nie udało się pobrać drugiego pliku XML. Sprawdź URL i dostępność pliku."
             return None, error_msg
-
-        self.feed1_data = self.parse_xml_feed(content1)
-        self.feed2_data = self.parse_xml_feed(content2)
         
         if not self.feed1_data:
             return None, "Pierwszy plik XML nie zawiera żadnych produktów lub ma nieprawidłowy format."
@@ -186,12 +720,12 @@ class XMLFeedComparator:
         
         # Pobierz atrybuty z pierwszego produktu z feed1
         if self.feed1_data:
-            first_product = list(self.feed1_data.values())[0]
+            first_product = next(iter(self.feed1_data.values()))
             all_attributes.update(first_product.keys())
         
         # Pobierz atrybuty z pierwszego produktu z feed2
         if self.feed2_data:
-            first_product = list(self.feed2_data.values())[0]
+            first_product = next(iter(self.feed2_data.values()))
             all_attributes.update(first_product.keys())
         
         return sorted(list(all_attributes)), {
@@ -199,32 +733,333 @@ class XMLFeedComparator:
             'total_feed2': len(self.feed2_data)
         }
     
-    def compare_feeds(self, excluded_attributes=None):
+    def _sniff_attributes(self):
+        """
+        Wariant get_all_attributes bez pobierania i parsowania całych feedów: atrybuty to
+        suma atrybutów pierwszych SNIFF_PRODUCTS produktów, liczby produktów mogą być szacunkowe.
+        """
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            sniffed = list(executor.map(self.sniff_feed, [self.source1, self.source2]))
+
+        all_attributes = set()
+        feed_info = {}
+        for feed, ordinal, (attributes, count, estimate, error) in zip((1, 2), ('Pierwszy', 'Drugi'), sniffed):
+            if attributes is None:
+                return None, f"{ordinal} plik XML - {error}"
+            if not count:
+                return None, f"{ordinal} plik XML nie zawiera żadnych produktów lub ma nieprawidłowy format."
+            all_attributes.update(attributes)
+            feed_info[f'total_feed{feed}'] = count
+            feed_info[f'total_feed{feed}_estimate'] = estimate
+        return sorted(all_attributes), feed_info
+
+    def compare_feeds(self, excluded_attributes=None, engine=None, full_recompute=False):
+        """
+        Porównuje oba feedy. engine wybiera silnik porównania atrybutów:
+        'python' (find_differences per produkt) albo 'pandas' (kolumnowo, wektorowo);
+        domyślnie Config.DIFF_ENGINE. Oba silniki zwracają identyczny wynik.
+        Przy włączonym INCREMENTAL_COMPARE ponownie porównywane są tylko produkty,
+        których odcisk zmienił się od poprzedniego porównania tej pary feedów;
+        full_recompute=True wymusza pełne przeliczenie.
+        """
         if excluded_attributes is None:
             excluded_attributes = []
+
+        contents = None
+        if Config.EXTERNAL_COMPARE_THRESHOLD > 0:
+            contents = self._fetch_feeds()
+            if contents is None:
+                return None
+            try:
+                largest = max(feed_size(content) for content in contents)
+            except DecompressionError as e:
+                self.last_error = self._decompression_error(e)
+                return None
+            if largest > Config.EXTERNAL_COMPARE_THRESHOLD:
+                return self._compare_external(contents, excluded_attributes)
             
-        content1 = self._get_xml_content(self.source1)
-        if content1 is None:
-            return None
-            
-        content2 = self._get_xml_content(self.source2)
-        if content2 is None:
+        if self._load_feeds(contents) is not None:
             return None
-
-        self.feed1_data = self.parse_xml_feed(content1)
-        self.feed2_data = self.parse_xml_feed(content2)
         
         if not self.feed1_data or not self.feed2_data:
             return None
-        
+
+        return self._compare_loaded(excluded_attributes, engine, full_recompute)
+
+    def _compare_loaded(self, excluded_attributes, engine=None, full_recompute=False):
+        """Porównuje już wczytane feed1_data i feed2_data (wynik w formacie compare_feeds)"""
         only_in_feed1 = set(self.feed1_data.keys()) - set(self.feed2_data.keys())
         only_in_feed2 = set(self.feed2_data.keys()) - set(self.feed1_data.keys())
         common_products = set(self.feed1_data.keys()) & set(self.feed2_data.keys())
         
+        diff_engine = self._diff_vectorized if (engine or Config.DIFF_ENGINE) == 'pandas' else self._diff_python
+        self._report_progress('compare', 0, len(common_products))
+        with metrics.stage('diff', engine=engine or Config.DIFF_ENGINE) as info:
+            if Config.INCREMENTAL_COMPARE and feed_cache:
+                sorted_differences, attribute_diff_count, diff_products_total = self._diff_incremental(
+                    diff_engine, common_products, excluded_attributes, full_recompute
+                )
+            else:
+                sorted_differences, attribute_diff_count, diff_products_total = diff_engine(common_products, set(excluded_attributes))
+            info['differences'] = len(sorted_differences)
+        metrics.inc('feedcompare_differences_total', len(sorted_differences))
+        self._report_progress('compare', len(common_products), len(common_products))
+        
+        # Sortuj statystyki atrybutów według liczby różnic (malejąco, przy remisie po nazwie)
+        attribute_stats = sorted(
+            [{'attribute': k, 'count': v} for k, v in attribute_diff_count.items()],
+            key=lambda x: (-x['count'], x['attribute'])
+        )
+
+        return {
+            'only_in_feed1': sorted(list(only_in_feed1)), 
+            'only_in_feed2': sorted(list(only_in_feed2)),
+            'differences': sorted_differences, 
+            'total_feed1': len(self.feed1_data),
+            'total_feed2': len(self.feed2_data),
+            'common_total': len(common_products),
+            'diff_products_total': diff_products_total,
+            'attribute_stats': attribute_stats  # Dodane: statystyki per atrybut
+        }
+
+    def _compare_external(self, contents, excluded_attributes):
+        """
+        Porównanie poza pamięcią dla feedów większych niż EXTERNAL_COMPARE_THRESHOLD.
+        Produkty każdego feedu są strumieniowo zapisywane na dysk w posortowanych
+        po ID porcjach, a następnie scalane i łączone (merge join) w jednym przebiegu.
+        W pamięci jest tylko jedna porcja naraz i wynik porównania; wynik jest
+        identyczny jak przy porównaniu w pamięci.
+        """
+        print(f"   Porównanie poza pamięcią (feed większy niż {Config.EXTERNAL_COMPARE_THRESHOLD} bajtów)")
+        excluded_attributes = set(excluded_attributes)
+        with tempfile.TemporaryDirectory(prefix='feedcompare-sort-', dir=Config.EXTERNAL_SORT_DIR) as directory:
+            runs = self._write_sorted_feeds(contents, directory)
+            if runs is None:
+                return None
+
+            only_in_feed1 = []
+            only_in_feed2 = []
+            sorted_differences = []
+            attribute_diff_count = {}
+            common_total = 0
+            diff_products_total = 0
+            with metrics.stage('diff', mode='external') as info:
+                for product_id, prod1, prod2 in merge_join(iter_sorted_products(runs[0]), iter_sorted_products(runs[1])):
+                    if prod2 is None:
+                        only_in_feed1.append(product_id)
+                        continue
+                    if prod1 is None:
+                        only_in_feed2.append(product_id)
+                        continue
+                    common_total += 1
+                    if common_total % PROGRESS_EVERY == 0:
+                        self._report_progress('compare', common_total)
+                    differences = self.find_differences(product_id, prod1, prod2, excluded_attributes)
+                    if differences:
+                        diff_products_total += 1
+                        for diff in sorted(differences, key=lambda d: d['Pole']):
+                            sorted_differences.append(diff)
+                            attribute_diff_count[diff['Pole']] = attribute_diff_count.get(diff['Pole'], 0) + 1
+                info['differences'] = len(sorted_differences)
+            metrics.inc('feedcompare_differences_total', len(sorted_differences))
+
+        total_feed1 = len(only_in_feed1) + common_total
+        total_feed2 = len(only_in_feed2) + common_total
+        if not total_feed1 or not total_feed2:
+            return None
+        self._report_progress('compare', common_total, common_total)
+
+        return {
+            'only_in_feed1': only_in_feed1,
+            'only_in_feed2': only_in_feed2,
+            'differences': sorted_differences,
+            'total_feed1': total_feed1,
+            'total_feed2': total_feed2,
+            'common_total': common_total,
+            'diff_products_total': diff_products_total,
+            'attribute_stats': sorted(
+                [{'attribute': k, 'count': v} for k, v in attribute_diff_count.items()],
+                key=lambda x: (-x['count'], x['attribute'])
+            ),
+        }
+
+    def _write_sorted_feeds(self, contents, directory):
+        """Zapisuje produkty obu feedów w posortowanych porcjach w directory; zwraca [porcje1, porcje2] albo None"""
+        runs = []
+        for feed, content in enumerate(contents, 1):
+            try:
+                with metrics.stage('parse', mode='external'):
+                    runs.append(write_sorted_runs(
+                        self.iter_products(content), directory, Config.EXTERNAL_SORT_RUN_SIZE, prefix=f"feed{feed}"
+                    ))
+            except DecompressionError as e:
+                self.last_error = self._decompression_error(e)
+                return None
+            except Exception as e:
+                print(f"Błąd parsowania: {str(e)}")
+                return None
+        return runs
+
+    def stream_comparison(self, excluded_attributes=None, max_differences=None, stop_on_attribute=None):
+        """
+        Porównanie strumieniowe dla /api/compare. Pobiera i parsuje oba feedy, po czym
+        zwraca generator rekordów NDJSON (exporters): only_in i difference w kolejności
+        znajdowania - bez sortowania i zbierania wszystkich różnic w pamięci - a na
+        końcu summary. Porównanie kończy się wcześniej po max_differences różnicach
+        albo po pierwszej różnicy w atrybucie stop_on_attribute. Feedy większe niż
+        EXTERNAL_COMPARE_THRESHOLD są łączone merge joinem z posortowanych porcji na
+        dysku. Przy błędzie zwraca None (komunikat w last_error).
+        """
+        contents = self._fetch_feeds()
+        if contents is None:
+            return None
+        largest = 0
+        if Config.EXTERNAL_COMPARE_THRESHOLD > 0:
+            try:
+                largest = max(feed_size(content) for content in contents)
+            except DecompressionError as e:
+                self.last_error = self._decompression_error(e)
+                return None
+
+        if largest > Config.EXTERNAL_COMPARE_THRESHOLD:
+            directory = tempfile.TemporaryDirectory(prefix='feedcompare-sort-', dir=Config.EXTERNAL_SORT_DIR)
+            runs = self._write_sorted_feeds(contents, directory.name)
+            if runs is None:
+                directory.cleanup()
+                return None
+            joined = merge_join(iter_sorted_products(runs[0]), iter_sorted_products(runs[1]))
+        else:
+            directory = None
+            if self._load_feeds(contents) is not None or not self.feed1_data or not self.feed2_data:
+                return None
+            joined = self._iter_joined()
+        return self._iter_comparison_records(joined, set(excluded_attributes or ()), max_differences, stop_on_attribute, directory)
+
+    def _iter_joined(self):
+        """
+        Wczytane feedy jako (product_id, produkt1, produkt2) jak w merge_join: najpierw
+        produkty tylko w feedzie 1 i tylko w feedzie 2, potem wspólne w kolejności feedu 1.
+        """
+        ids1, ids2 = set(self.feed1_data.keys()), set(self.feed2_data.keys())
+        for product_id in sorted(ids1 - ids2):
+            yield product_id, self.feed1_data[product_id], None
+        for product_id in sorted(ids2 - ids1):
+            yield product_id, None, self.feed2_data[product_id]
+        for product_id in self.feed1_data.keys():
+            if product_id in ids2:
+                yield product_id, self.feed1_data[product_id], self.feed2_data[product_id]
+
+    def _iter_comparison_records(self, joined, excluded_attributes, max_differences, stop_on_attribute, directory=None):
+        """Rekordy porównania strumieniowego; summary liczy tylko produkty przetworzone przed zatrzymaniem"""
+        only_in = {1: 0, 2: 0}
+        common_total = 0
+        differences_total = 0
+        diff_products_total = 0
+        attribute_diff_count = {}
+        stopped_by = None
+        try:
+            with metrics.stage('diff', mode='stream') as info:
+                for product_id, prod1, prod2 in joined:
+                    if prod1 is None or prod2 is None:
+                        feed = 1 if prod2 is None else 2
+                        only_in[feed] += 1
+                        yield only_in_record(feed, product_id)
+                        continue
+                    common_total += 1
+                    differences = self.find_differences(product_id, prod1, prod2, excluded_attributes)
+                    if differences:
+                        diff_products_total += 1
+                    for diff in sorted(differences, key=lambda d: d['Pole']):
+                        differences_total += 1
+                        attribute_diff_count[diff['Pole']] = attribute_diff_count.get(diff['Pole'], 0) + 1
+                        yield difference_record(product_id, diff['Pole'], diff['Wartość Feed 1'], diff['Wartość Feed 2'])
+                        if max_differences and differences_total >= max_differences:
+                            stopped_by = 'max_differences'
+                        elif stop_on_attribute is not None and diff['Pole'] == stop_on_attribute:
+                            stopped_by = 'stop_on_attribute'
+                        if stopped_by:
+                            break
+                    if stopped_by:
+                        break
+                info['differences'] = differences_total
+            metrics.inc('feedcompare_differences_total', differences_total)
+
+            yield summary_record({
+                'total_feed1': only_in[1] + common_total,
+                'total_feed2': only_in[2] + common_total,
+                'common_total': common_total,
+                'only_in_feed1_total': only_in[1],
+                'only_in_feed2_total': only_in[2],
+                'diff_products_total': diff_products_total,
+                'differences_total': differences_total,
+                'attribute_stats': sorted(
+                    [{'attribute': k, 'count': v} for k, v in attribute_diff_count.items()],
+                    key=lambda x: (-x['count'], x['attribute'])
+                ),
+                'complete': stopped_by is None,
+                'stopped_by': stopped_by,
+            })
+        finally:
+            if directory is not None:
+                directory.cleanup()
+
+    def _diff_incremental(self, diff_engine, common_products, excluded_attributes, full_recompute):
+        """
+        Porównanie przyrostowe: odciski produktów i różnice z poprzedniego porównania
+        tej samej pary feedów (z tymi samymi wykluczeniami) są zapisywane w cache.
+        Silnikiem porównywane są tylko produkty, których odcisk zmienił się po
+        którejkolwiek stronie - różnice pozostałych są przenoszone bez zmian.
+        """
+        state_key = hashlib.sha256(json.dumps(
+            [self.source1, self.source2, sorted(excluded_attributes), self.PARSER_VERSION, self.FINGERPRINT_VERSION]
+        ).encode('utf-8')).hexdigest()
+        # Odciski z parsowania (zapisane razem ze snapshotem); bez nich liczone tylko dla wspólnych produktów
+        fingerprints1 = self.fingerprints.get(1) or {product_id: product_fingerprint(self.feed1_data[product_id]) for product_id in common_products}
+        fingerprints2 = self.fingerprints.get(2) or {product_id: product_fingerprint(self.feed2_data[product_id]) for product_id in common_products}
+
+        previous = None if full_recompute else feed_cache.load_comparison_state(state_key)
+        if previous is None:
+            changed_products = common_products
+            carried_differences = []
+        else:
+            previous1, previous2, previous_differences = previous['fingerprints1'], previous['fingerprints2'], previous['differences']
+            changed_products = {
+                product_id for product_id in common_products
+                if fingerprints1[product_id] != previous1.get(product_id) or fingerprints2[product_id] != previous2.get(product_id)
+            }
+            carried_differences = [
+                {'Product ID': product_id, 'Pole': key, 'Wartość Feed 1': val1, 'Wartość Feed 2': val2}
+                for product_id in common_products - changed_products
+                for key, val1, val2 in previous_differences.get(product_id, ())
+            ]
+        print(f"   Porównanie przyrostowe: {len(changed_products)} z {len(common_products)} produktów do przeliczenia")
+
+        new_differences, _, _ = diff_engine(changed_products, set(excluded_attributes))
+        sorted_differences = sorted(carried_differences + new_differences, key=lambda d: (d['Product ID'], d['Pole']))
+
+        attribute_diff_count = {}
+        differences_by_product = {}
+        for diff in sorted_differences:
+            attribute_diff_count[diff['Pole']] = attribute_diff_count.get(diff['Pole'], 0) + 1
+            differences_by_product.setdefault(diff['Product ID'], []).append(
+                (diff['Pole'], diff['Wartość Feed 1'], diff['Wartość Feed 2'])
+            )
+
+        feed_cache.store_comparison_state(state_key, {
+            'fingerprints1': fingerprints1,
+            'fingerprints2': fingerprints2,
+            'differences': differences_by_product,
+        })
+        return sorted_differences, attribute_diff_count, len(differences_by_product)
+
+    def _diff_python(self, common_products, excluded_attributes):
+        """Silnik 'python': find_differences dla każdego wspólnego produktu"""
         products_with_differences = []
         attribute_diff_count = {}  # Licznik różnic per atrybut
         
-        for product_id in common_products:
+        for done, product_id in enumerate(common_products, 1):
+            if done % PROGRESS_EVERY == 0:
+                self._report_progress('compare', done, len(common_products))
             prod1 = self.feed1_data[product_id]
             prod2 = self.feed2_data[product_id]
             differences = self.find_differences(product_id, prod1, prod2, excluded_attributes)
@@ -236,24 +1071,54 @@ class XMLFeedComparator:
                     attribute_diff_count[attr_name] = attribute_diff_count.get(attr_name, 0) + 1
 
         sorted_differences = sorted(products_with_differences, key=lambda d: (d['Product ID'], d['Pole']))
-        
-        # Sortuj statystyki atrybutów według liczby różnic (malejąco)
-        attribute_stats = sorted(
-            [{'attribute': k, 'count': v} for k, v in attribute_diff_count.items()],
-            key=lambda x: x['count'],
-            reverse=True
-        )
+        diff_products_total = len(set(d['Product ID'] for d in products_with_differences))
+        return sorted_differences, attribute_diff_count, diff_products_total
 
-        return {
-            'only_in_feed1': sorted(list(only_in_feed1)), 
-            'only_in_feed2': sorted(list(only_in_feed2)),
-            'differences': sorted_differences, 
-            'total_feed1': len(self.feed1_data),
-            'total_feed2': len(self.feed2_data),
-            'common_total': len(common_products),
-            'diff_products_total': len(set(d['Product ID'] for d in products_with_differences)),
-            'attribute_stats': attribute_stats  # Dodane: statystyki per atrybut
-        }
+    def _diff_vectorized(self, common_products, excluded_attributes):
+        """
+        Silnik 'pandas': oba feedy jako kolumny indeksowane ID produktu, każdy
+        atrybut porównywany jedną operacją wektorową. Produkty przetwarzane są
+        porcjami po VECTOR_CHUNK_SIZE, żeby ograniczyć rozmiar macierzy w pamięci.
+        """
+        product_ids = sorted(common_products)
+        differences = []
+        attribute_diff_count = {}
+        diff_products_total = 0
+
+        for start in range(0, len(product_ids), VECTOR_CHUNK_SIZE):
+            chunk_ids = product_ids[start:start + VECTOR_CHUNK_SIZE]
+            records1 = [self.feed1_data[pid] for pid in chunk_ids]
+            records2 = [self.feed2_data[pid] for pid in chunk_ids]
+            # Kolumny posortowane - np.nonzero zwraca wtedy różnice w kolejności (Product ID, Pole)
+            columns = sorted(set().union(*records1, *records2) - excluded_attributes)
+            values1 = pd.DataFrame.from_records(records1, columns=columns).to_numpy(dtype=object)
+            values2 = pd.DataFrame.from_records(records2, columns=columns).to_numpy(dtype=object)
+
+            # Brakujące atrybuty to NaN (NaN != NaN), więc kandydaci obejmują też komórki
+            # pustych w obu feedach - po zamianie NaN na [BRAK] zostają tylko prawdziwe różnice
+            rows, cols = np.nonzero(values1 != values2)
+            candidates1 = values1[rows, cols]
+            candidates2 = values2[rows, cols]
+            candidates1[pd.isna(candidates1)] = '[BRAK]'
+            candidates2[pd.isna(candidates2)] = '[BRAK]'
+            is_difference = candidates1 != candidates2
+            rows, cols = rows[is_difference], cols[is_difference]
+            candidates1, candidates2 = candidates1[is_difference], candidates2[is_difference]
+
+            diff_products_total += len(np.unique(rows))
+            for column_index, count in enumerate(np.bincount(cols, minlength=len(columns)).tolist()):
+                if count:
+                    attribute_diff_count[columns[column_index]] = attribute_diff_count.get(columns[column_index], 0) + count
+
+            ids_column = np.array(chunk_ids, dtype=object)[rows].tolist()
+            attrs_column = np.array(columns, dtype=object)[cols].tolist()
+            differences.extend(
+                {'Product ID': product_id, 'Pole': key, 'Wartość Feed 1': val1, 'Wartość Feed 2': val2}
+                for product_id, key, val1, val2 in zip(ids_column, attrs_column, candidates1.tolist(), candidates2.tolist())
+            )
+            self._report_progress('compare', start + len(chunk_ids), len(product_ids))
+
+        return differences, attribute_diff_count, diff_products_total
     
     def find_differences(self, product_id, prod1, prod2, excluded_attributes=None):
         if excluded_attributes is None:
@@ -277,55 +1142,140 @@ class XMLFeedComparator:
                     'Wartość Feed 2': val2
                 })
         
-        if excluded_count > 0 and len(differences) > 0:
-            print(f"   Produkt {product_id}: znaleziono {len(differences)} różnic (pominięto {excluded_count} atrybutów)")
+        if excluded_count > 0 and differences and logger.isEnabledFor(logging.DEBUG):
+            # Próbkowanie - co LOG_SAMPLE_EVERY-ty produkt z różnicami, żeby logowanie nie spowalniało porównania
+            self.logged_products += 1
+            if (self.logged_products - 1) % max(Config.LOG_SAMPLE_EVERY, 1) == 0:
+                logger.debug(f"Produkt {product_id}: znaleziono {len(differences)} różnic (pominięto {excluded_count} atrybutów)")
         
         return differences
 
-    def generate_excel_report(self, excluded_attributes=None):
-        comparison_results = self.compare_feeds(excluded_attributes)
+    def generate_excel_report(self, excluded_attributes=None, comparison_results=None):
+        """
+        Raport Excel jako plik tymczasowy (zapis strumieniowy, wiersz po wierszu).
+        comparison_results pozwala użyć gotowego wyniku: słownika z compare_feeds
+        albo zapisanego wyniku zadania (StoredResult).
+        """
+        if comparison_results is None:
+            comparison_results = self.compare_feeds(excluded_attributes)
         if comparison_results is None:
             return None
+        if isinstance(comparison_results, dict):
+            comparison_results = (InMemoryMultiResult if 'matrix' in comparison_results else InMemoryResult)(comparison_results)
+        with metrics.stage('excel'):
+            return xlsx_file(comparison_results)
 
-        output_buffer = io.BytesIO()
-        with pd.ExcelWriter(output_buffer, engine='openpyxl') as writer:
-            summary_data = {
-                'Metryka': ['Produkty w Feed 1', 'Produkty w Feed 2', 'Produkty tylko w Feed 1', 'Produkty tylko w Feed 2', 'Produkty wspólne', 'Produkty z różnicami'],
-                'Wartość': [
-                    comparison_results['total_feed1'], 
-                    comparison_results['total_feed2'], 
-                    len(comparison_results['only_in_feed1']), 
-                    len(comparison_results['only_in_feed2']), 
-                    comparison_results['common_total'],
-                    comparison_results['diff_products_total']
-                ]
-            }
-            pd.DataFrame(summary_data).to_excel(writer, sheet_name='Podsumowanie', index=False)
-            
-            # Dodaj statystyki różnic per atrybut
-            if comparison_results.get('attribute_stats'):
-                attr_stats_data = []
-                for stat in comparison_results['attribute_stats']:
-                    percentage = (stat['count'] / comparison_results['common_total'] * 100) if comparison_results['common_total'] > 0 else 0
-                    attr_stats_data.append({
-                        'Atrybut': stat['attribute'],
-                        'Liczba różnic': stat['count'],
-                        'Procent produktów (%)': round(percentage, 1)
-                    })
-                df_attr_stats = pd.DataFrame(attr_stats_data)
-                df_attr_stats.to_excel(writer, sheet_name='Statystyki atrybutów', index=False)
-            
-            if comparison_results['only_in_feed1']:
-                pd.DataFrame({'Product ID': comparison_results['only_in_feed1']}).to_excel(writer, sheet_name='Tylko w Feed 1', index=False)
-            if comparison_results['only_in_feed2']:
-                pd.DataFrame({'Product ID': comparison_results['only_in_feed2']}).to_excel(writer, sheet_name='Tylko w Feed 2', index=False)
-            
-            if comparison_results['differences']:
-                df_diff = pd.DataFrame(comparison_results['differences'])
-                df_diff.to_excel(writer, sheet_name='Szczegółowe Różnice', index=False)
 
-        output_buffer.seek(0)
-        return output_buffer
+class MultiFeedComparator:
+    """
+    Porównanie N-way: jeden feed bazowy z wieloma feedami docelowymi. Feed bazowy
+    jest pobierany i parsowany raz, a feedy docelowe pobierane, parsowane
+    i porównywane w wątkach (MULTI_COMPARE_WORKERS naraz) z tą samą mapą
+    produktów bazy. Równolegle naprawdę działają tylko pobieranie i - przy
+    PARSE_WORKERS > 0 - parsowanie w puli procesów; porównanie atrybutów dzieli GIL,
+    więc czas rośnie z liczbą feedów docelowych.
+    """
+
+    def __init__(self, baseline, targets):
+        self.baseline = baseline
+        self.targets = list(targets)
+        self.last_error = None
+        # Odciski produktów bazy (porównanie przyrostowe), ustawiane po wczytaniu feedu bazowego
+        self.baseline_fingerprints = None
+        # Opcjonalny callback postępu: progress_callback(etap, porównane feedy, wszystkie)
+        self.progress_callback = None
+
+    def _report_progress(self, stage, done=None, total=None):
+        if self.progress_callback:
+            self.progress_callback(stage, done, total)
+
+    def compare(self, excluded_attributes=None, engine=None, full_recompute=False):
+        """
+        Zwraca słownik {'baseline', 'total_baseline', 'targets', 'matrix'}, gdzie targets to
+        lista {'feed', 'error', 'result'} (result w formacie compare_feeds: Feed 1 to baza,
+        Feed 2 to feed docelowy), a matrix to posortowana lista (product_id, komórki)
+        produktów różniących się w którymkolwiek feedzie. Błąd pojedynczego feedu
+        docelowego trafia do jego 'error'; gdy nie da się wczytać bazy, zwraca None
+        (komunikat w last_error).
+        """
+        if excluded_attributes is None:
+            excluded_attributes = []
+        self._report_progress('download')
+        workers = max(min(len(self.targets) + 1, Config.MULTI_COMPARE_WORKERS), 1)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Baza jest zlecana pierwsza, więc zawsze dostaje wątek - feedy docelowe czekają na nią już po parsowaniu
+            baseline_future = executor.submit(in_job(self._load_baseline))
+            futures = [
+                executor.submit(in_job(self._compare_target), target, baseline_future, excluded_attributes, engine, full_recompute)
+                for target in self.targets
+            ]
+            targets = []
+            for done, (target, future) in enumerate(zip(self.targets, futures), 1):
+                result, error = future.result()
+                targets.append({'feed': target, 'error': error, 'result': result})
+                self._report_progress('targets', done, len(self.targets))
+
+        baseline_products = baseline_future.result()
+        if not baseline_products:
+            return None
+        return {
+            'baseline': self.baseline,
+            'total_baseline': len(baseline_products),
+            'targets': targets,
+            'matrix': difference_matrix([entry['result'] for entry in targets]),
+        }
+
+    def _load_baseline(self):
+        comparator = XMLFeedComparator(self.baseline, None)
+        products, error = comparator._load_feed(self.baseline, feed=1)
+        self.baseline_fingerprints = comparator.fingerprints.get(1)
+        if error:
+            self.last_error = f"Feed bazowy - {error}"
+        elif not products:
+            self.last_error = "Feed bazowy nie zawiera żadnych produktów lub ma nieprawidłowy format."
+        return products
+
+    def _compare_target(self, target, baseline_future, excluded_attributes, engine, full_recompute):
+        """Wczytuje feed docelowy i porównuje go z bazą; zwraca krotkę (wynik, komunikat_błędu)"""
+        comparator = XMLFeedComparator(self.baseline, target)
+        products, error = comparator._load_feed(target, feed=2)
+        baseline_products = baseline_future.result()
+        if not baseline_products:
+            return None, None
+        if products is None or error:
+            return None, error
+        if not products:
+            return None, "Plik XML nie zawiera żadnych produktów lub ma nieprawidłowy format."
+        comparator.feed1_data = baseline_products
+        comparator.feed2_data = products
+        if self.baseline_fingerprints is not None:
+            comparator.fingerprints[1] = self.baseline_fingerprints
+        return comparator._compare_loaded(excluded_attributes, engine, full_recompute), None
+
+
+# Komórki macierzy różnic N-way: produkt tylko w bazie / tylko w feedzie docelowym
+MATRIX_MISSING = '[BRAK]'
+MATRIX_EXTRA = '[TYLKO W FEEDZIE]'
+
+def difference_matrix(results):
+    """
+    Macierz różnic N-way z wyników porównań bazy z kolejnymi feedami: lista
+    (product_id, [komórka per feed]) posortowana po ID, tylko produkty z jakąkolwiek
+    różnicą. Komórka to '' (brak różnic lub wynik niedostępny), MATRIX_MISSING,
+    MATRIX_EXTRA albo lista różniących się atrybutów rozdzielona przecinkami.
+    """
+    cells = {}
+    for index, result in enumerate(results):
+        if result is None:
+            continue
+        for product_id in result['only_in_feed1']:
+            cells.setdefault(product_id, [''] * len(results))[index] = MATRIX_MISSING
+        for product_id in result['only_in_feed2']:
+            cells.setdefault(product_id, [''] * len(results))[index] = MATRIX_EXTRA
+        for diff in result['differences']:
+            row = cells.setdefault(diff['Product ID'], [''] * len(results))
+            row[index] = f"{row[index]}, {diff['Pole']}" if row[index] else diff['Pole']
+    return sorted(cells.items())
 
 
 # --- Aplikacja Flask ---
@@ -345,6 +1295,11 @@ def index():
     last_feed2 = session.get('last_feed2', '')
     return render_template('index.html', last_feed1=last_feed1, last_feed2=last_feed2)
 
+def render_stage(template_name, **context):
+    """render_template z pomiarem czasu etapu 'render'"""
+    with metrics.stage('render', template=template_name):
+        return render_template(template_name, **context)
+
 @app.route('/analyze', methods=['POST'])
 def analyze():
     feed1_url = request.form['feed1']
@@ -365,14 +1320,137 @@ def analyze():
         error_message = feed_info_or_error if isinstance(feed_info_or_error, str) else "Nie udało się przetworzyć plików. Sprawdź adresy URL i format XML."
         return render_template('index.html', error=error_message, last_feed1=feed1_url, last_feed2=feed2_url)
 
-    return render_template(
+    return render_stage(
         'select_attributes.html',
         attributes=attributes,
         feed_info=feed_info_or_error,
+        profiling=bool(Config.PROFILE_DIR),
+        incremental=Config.INCREMENTAL_COMPARE,
         feed1_url=feed1_url,
         feed2_url=feed2_url
     )
 
+def comparison_job_key(feed1_url, feed2_url, excluded_attributes):
+    """Klucz identycznych porównań (ta sama para feedów i wykluczenia) - do łączenia zadań"""
+    payload = json.dumps([feed1_url, feed2_url, sorted(excluded_attributes)])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def run_comparison_job(job, feed1_url, feed2_url, excluded_attributes, full_recompute=False, profile=False):
+    """
+    Funkcja zadania w tle: porównuje feedy i zapisuje wynik. Zwraca komunikat błędu lub None.
+    Rejestruje przyrost pamięci w trakcie porównania i szczytową pamięć procesu; przy profile=True
+    (i ustawionym PROFILE_DIR) zapisuje profil cProfile zadania do PROFILE_DIR/<id>.prof.
+    """
+    return run_measured_job(job, profile, _run_comparison, job, feed1_url, feed2_url, excluded_attributes, full_recompute)
+
+def run_multi_comparison_job(job, baseline_url, target_urls, excluded_attributes, full_recompute=False, profile=False):
+    """Funkcja zadania w tle dla porównania N-way (jak run_comparison_job)"""
+    return run_measured_job(job, profile, _run_multi_comparison, job, baseline_url, target_urls, excluded_attributes, full_recompute)
+
+def run_measured_job(job, profile, fn, *args):
+    """
+    Uruchamia fn(*args) jako zadanie job: logi etapów zawierają id zadania, przyrost
+    pamięci jest próbkowany na granicach etapów, a przy profile=True profil cProfile
+    obejmuje wątek zadania i wątki robocze (in_job) - zapisywany jako jeden plik.
+    Szczytowa pamięć (VmHWM) dotyczy całego procesu, więc nie jest zerowana per zadanie.
+    """
+    run = JobRun(job.job_id, profile=bool(profile and Config.PROFILE_DIR))
+    try:
+        with run.thread():
+            error = fn(*args)
+    finally:
+        if run.profiles is not None:
+            os.makedirs(Config.PROFILE_DIR, exist_ok=True)
+            profile_path = os.path.join(Config.PROFILE_DIR, f"{job.job_id}.prof")
+            if run.dump_stats(profile_path):
+                print(f"📈 Profil zadania zapisany: {profile_path}")
+    rss_growth = run.rss_growth()
+    if rss_growth is not None:
+        metrics.observe('feedcompare_comparison_rss_growth_bytes', rss_growth)
+    metrics.observe('feedcompare_comparison_peak_rss_bytes', peak_rss())
+    metrics.inc('feedcompare_comparisons_total', status='error' if error else 'done')
+    logger.info(f"job={job.job_id} status={'error' if error else 'done'} rss_growth_bytes={rss_growth} process_peak_rss_bytes={peak_rss()}")
+    return error
+
+def _run_comparison(job, feed1_url, feed2_url, excluded_attributes, full_recompute):
+    comparator = XMLFeedComparator(feed1_url, feed2_url)
+    comparator.progress_callback = job.progress
+    results = comparator.compare_feeds(excluded_attributes, full_recompute=full_recompute)
+
+    if results is None:
+        print("❌ Błąd: results jest None!")
+        return f"Błąd: {comparator.last_error}" if comparator.last_error else "Nie udało się przetworzyć plików. Sprawdź adresy URL i format XML."
+
+    print(f"✅ Porównanie zakończone:")
+    print(f"   Produkty z różnicami: {results['diff_products_total']}")
+    print(f"   Liczba różnic: {len(results['differences'])}")
+
+    job.progress('save')
+    save_results(job.result_path, results)
+    return None
+
+def _run_multi_comparison(job, baseline_url, target_urls, excluded_attributes, full_recompute):
+    comparator = MultiFeedComparator(baseline_url, target_urls)
+    comparator.progress_callback = job.progress
+    results = comparator.compare(excluded_attributes, full_recompute=full_recompute)
+
+    if results is None:
+        print("❌ Błąd: results jest None!")
+        return f"Błąd: {comparator.last_error}" if comparator.last_error else "Nie udało się przetworzyć feedu bazowego. Sprawdź adres URL i format XML."
+
+    print(f"✅ Porównanie N-way zakończone:")
+    for entry in results['targets']:
+        if entry['error']:
+            print(f"   {entry['feed']}: błąd - {entry['error']}")
+        else:
+            print(f"   {entry['feed']}: {entry['result']['diff_products_total']} produktów z różnicami")
+
+    job.progress('save')
+    save_multi_results(job.result_path, results)
+    return None
+
+job_manager = JobManager(Config.JOBS_DIR, Config.JOB_WORKERS, Config.JOB_RESULT_TTL)
+
+# Zaplanowane porównania zarejestrowanych par - osobna pula zadań, żeby nie blokować porównań użytkowników
+scheduled_pairs = load_scheduled_pairs(Config.SCHEDULED_COMPARISONS_FILE)
+scheduled_job_manager = JobManager(Config.JOBS_DIR, Config.SCHEDULER_WORKERS, Config.JOB_RESULT_TTL)
+
+def submit_scheduled_comparison(pair):
+    job_id = scheduled_job_manager.submit(
+        comparison_job_key(pair['feed1'], pair['feed2'], pair['excluded_attributes']),
+        dict(pair, scheduled=True),
+        run_comparison_job, pair['feed1'], pair['feed2'], pair['excluded_attributes']
+    )
+    print(f"⏰ Zaplanowane porównanie {pair['feed1']} / {pair['feed2']}: zadanie {job_id}")
+
+def precomputed_result(feed1_url, feed2_url, excluded_attributes):
+    """Stan najnowszego zakończonego zadania dla zarejestrowanej pary feedów albo None"""
+    for pair in scheduled_pairs:
+        if (pair['feed1'], pair['feed2'], pair['excluded_attributes']) == (feed1_url, feed2_url, sorted(excluded_attributes)):
+            return job_manager.latest_done(comparison_job_key(feed1_url, feed2_url, excluded_attributes))
+    return None
+
+def format_age(seconds):
+    """Wiek wyniku w czytelnej postaci: '5 min', '3 godz. 20 min'"""
+    minutes = int(seconds // 60)
+    if minutes < 1:
+        return 'mniej niż minutę'
+    if minutes < 60:
+        return f"{minutes} min"
+    return f"{minutes // 60} godz. {minutes % 60} min"
+
+scheduler = ComparisonScheduler(
+    scheduled_pairs,
+    Config.SCHEDULE_INTERVAL,
+    os.path.join(Config.JOBS_DIR, 'scheduler.lock'),
+    submit_scheduled_comparison,
+    lambda pair: (precomputed_result(pair['feed1'], pair['feed2'], pair['excluded_attributes']) or {}).get('finished_at')
+)
+if __name__ != '__mp_main__':
+    # Procesy puli parsowania importują główny moduł jako __mp_main__ (python app.py) -
+    # harmonogram działa tylko w procesie aplikacji
+    scheduler.start()
+
 @app.route('/compare', methods=['POST'])
 def compare():
     feed1_url = request.form['feed1']
@@ -380,6 +1458,12 @@ def compare():
     
     # Pobierz wykluczone atrybuty z formularza (checkboxy)
     excluded_attributes = request.form.getlist('excluded_attributes')
+    # Pełne przeliczenie zamiast porównania przyrostowego
+    full_recompute = request.form.get('full_recompute') == '1'
+    # Profil cProfile tego porównania (tylko przy ustawionym PROFILE_DIR)
+    profile = bool(Config.PROFILE_DIR) and (request.form.get('profile') or request.args.get('profile')) == '1'
+    # Ponowne porównanie zamiast gotowego wyniku zaplanowanego porównania
+    refresh = request.form.get('refresh') == '1'
     
     print(f"🔍 Rozpoczynam porównanie:")
     print(f"   Feed 1: {feed1_url}")
@@ -393,40 +1477,251 @@ def compare():
 
     if not feed1_url or not feed2_url:
         return render_template('index.html', error="Proszę podać oba adresy URL.", last_feed1=feed1_url, last_feed2=feed2_url)
+
+    # Zarejestrowana para: od razu najnowszy wynik zaplanowanego porównania (z jego wiekiem na stronie wyników)
+    precomputed = None if refresh or full_recompute or profile else precomputed_result(feed1_url, feed2_url, excluded_attributes)
+    if precomputed:
+        print(f"   Wynik zaplanowanego porównania sprzed {format_age(time.time() - precomputed['finished_at'])}")
+        return redirect(url_for('job_results', job_id=precomputed['id']))
     
-    comparator = XMLFeedComparator(feed1_url, feed2_url)
-    results = comparator.compare_feeds(excluded_attributes)
+    # Porównanie działa w tle - identyczne trwające porównania są łączone w jedno zadanie
+    job_id = job_manager.submit(
+        comparison_job_key(feed1_url, feed2_url, excluded_attributes),
+        {'feed1': feed1_url, 'feed2': feed2_url, 'excluded_attributes': excluded_attributes},
+        run_comparison_job, feed1_url, feed2_url, excluded_attributes, full_recompute, profile
+    )
+    return redirect(url_for('job_progress', job_id=job_id))
 
-    if results is None:
-        print("❌ Błąd: results jest None!")
-        error_msg = f"Błąd: {comparator.last_error}" if comparator.last_error else "Nie udało się przetworzyć plików. Sprawdź adresy URL i format XML."
-        return render_template('index.html', error=error_msg, last_feed1=feed1_url, last_feed2=feed2_url)
+@app.route('/compare_many', methods=['POST'])
+def compare_many():
+    """Porównanie N-way: feed bazowy z wieloma feedami docelowymi (po jednym URL w linii)"""
+    baseline_url = request.form.get('baseline', '').strip()
+    target_urls = [line.strip() for line in request.form.get('targets', '').splitlines() if line.strip()]
+    excluded_attributes = [attr.strip() for attr in request.form.get('excluded_attributes', '').split(',') if attr.strip()]
+    full_recompute = request.form.get('full_recompute') == '1'
 
-    print(f"✅ Porównanie zakończone:")
-    print(f"   Produkty z różnicami: {results['diff_products_total']}")
-    print(f"   Liczba różnic: {len(results['differences'])}")
+    print(f"🔍 Rozpoczynam porównanie N-way:")
+    print(f"   Feed bazowy: {baseline_url}")
+    print(f"   Feedy docelowe ({len(target_urls)}): {target_urls}")
+    print(f"   Wykluczone atrybuty ({len(excluded_attributes)}): {excluded_attributes}")
 
-    return render_template(
-        'results.html', 
+    session['last_baseline'] = baseline_url
+    session['last_targets'] = '\n'.join(target_urls)
+
+    if not baseline_url or not target_urls:
+        return render_template('index.html', error="Proszę podać feed bazowy i co najmniej jeden feed docelowy.", last_feed1=session.get('last_feed1', ''), last_feed2=session.get('last_feed2', ''))
+    if len(target_urls) > Config.MAX_TARGET_FEEDS:
+        return render_template('index.html', error=f"Można porównać najwyżej {Config.MAX_TARGET_FEEDS} feedów docelowych naraz.", last_feed1=session.get('last_feed1', ''), last_feed2=session.get('last_feed2', ''))
+
+    job_id = job_manager.submit(
+        comparison_job_key(baseline_url, target_urls, excluded_attributes),
+        {'baseline': baseline_url, 'targets': target_urls, 'excluded_attributes': excluded_attributes},
+        run_multi_comparison_job, baseline_url, target_urls, excluded_attributes, full_recompute
+    )
+    return redirect(url_for('job_progress', job_id=job_id))
+
+def job_result_path(job, target=None):
+    """
+    Plik wyniku zakończonego zadania. Dla porównania N-way target (od 1) wskazuje
+    wynik jednego feedu docelowego; zwraca None, gdy takiego wyniku nie ma.
+    """
+    path = job_manager.result_path(job['id'])
+    if target is None:
+        return path
+    if 'targets' not in job['params'] or not 1 <= target <= len(job['params']['targets']):
+        return None
+    path = target_result_path(path, target)
+    return path if os.path.exists(path) else None
+
+@app.route('/jobs/<job_id>')
+def job_progress(job_id):
+    job = job_manager.status(job_id)
+    if job is None:
+        return render_template('index.html', error="Nie znaleziono zadania porównania (mogło wygasnąć).", last_feed1=session.get('last_feed1', ''), last_feed2=session.get('last_feed2', ''))
+    if job['status'] == 'done':
+        return redirect(url_for('job_results', job_id=job_id))
+    return render_template('progress.html', job=job)
+
+@app.route('/jobs/<job_id>/status')
+def job_status(job_id):
+    job = job_manager.status(job_id)
+    if job is None:
+        return jsonify({'error': 'Nie znaleziono zadania'}), 404
+    return jsonify({key: job[key] for key in ('id', 'status', 'stage', 'done', 'total', 'percent', 'error')})
+
+@app.route('/results/<job_id>')
+def job_results(job_id):
+    job = job_manager.status(job_id)
+    if job is None or job['status'] != 'done':
+        return redirect(url_for('job_progress', job_id=job_id))
+
+    target = request.args.get('target', type=int)
+    if 'targets' in job['params'] and target is None:
+        # Porównanie N-way: podsumowanie feedów i początek macierzy różnic
+        result = StoredMultiResult(job_result_path(job))
+        return render_stage(
+            'multi_results.html',
+            results=result.summary,
+            matrix=list(result.iter_matrix(limit=MATRIX_PREVIEW_ROWS)),
+            job_id=job_id,
+            excluded_attributes=job['params']['excluded_attributes']
+        )
+
+    result_path = job_result_path(job, target)
+    if result_path is None:
+        return render_template('index.html', error="Nie znaleziono wyniku dla wybranego feedu.", last_feed1=session.get('last_feed1', ''), last_feed2=session.get('last_feed2', ''))
+
+    # Strona dostaje tylko podsumowanie - wiersze różnic pobiera stronicowo z API
+    results = load_summary(result_path)
+    return render_stage(
+        'results.html',
         results=results,
-        feed1_url=feed1_url,
-        feed2_url=feed2_url,
-        excluded_attributes=excluded_attributes
+        job_id=job_id,
+        target=target,
+        finished_at=datetime.fromtimestamp(job['finished_at']).strftime('%Y-%m-%d %H:%M'),
+        result_age=format_age(time.time() - job['finished_at']),
+        feed1_url=job['params']['baseline'] if target else job['params']['feed1'],
+        feed2_url=job['params']['targets'][target - 1] if target else job['params']['feed2'],
+        excluded_attributes=job['params']['excluded_attributes']
     )
 
+@app.route('/api/results/<job_id>/differences')
+def api_differences(job_id):
+    """
+    Stronicowana lista różnic zapisanego wyniku.
+    Parametry: page, per_page (max 1000), attribute (można powtórzyć),
+    product_prefix, sort (product/attribute), order (asc/desc); dla porównania
+    N-way target - numer feedu docelowego (od 1).
+    """
+    job = job_manager.status(job_id)
+    if job is None or job['status'] != 'done':
+        return jsonify({'error': 'Nie znaleziono zakończonego porównania'}), 404
+    result_path = job_result_path(job, request.args.get('target', type=int, default=1 if 'targets' in job['params'] else None))
+    if result_path is None:
+        return jsonify({'error': 'Nie znaleziono wyniku dla wybranego feedu'}), 404
+
+    sort = request.args.get('sort', 'product')
+    if sort not in SORT_COLUMNS:
+        return jsonify({'error': f"Nieprawidłowe sortowanie: {sort}"}), 400
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+        per_page = min(max(int(request.args.get('per_page', 100)), 1), 1000)
+    except ValueError:
+        return jsonify({'error': 'Parametry page i per_page muszą być liczbami'}), 400
+
+    total, differences = query_differences(
+        result_path,
+        attributes=request.args.getlist('attribute') or None,
+        product_prefix=request.args.get('product_prefix', '').strip() or None,
+        sort=sort,
+        descending=request.args.get('order') == 'desc',
+        offset=(page - 1) * per_page,
+        limit=per_page
+    )
+    return jsonify({
+        'page': page,
+        'per_page': per_page,
+        'total': total,
+        'pages': (total + per_page - 1) // per_page,
+        'differences': differences
+    })
+
+@app.route('/api/compare', methods=['POST'])
+def api_compare():
+    """
+    Porównanie strumieniowe dla CI i innych programów: odpowiedź NDJSON z rekordem
+    header wysyłanym od razu, rekordami only_in i difference wysyłanymi w trakcie
+    porównania, a na końcu summary (albo error, gdy feedu nie udało się pobrać lub
+    sparsować). Parametry (obiekt JSON lub formularz): feed1, feed2,
+    excluded_attributes (lista, powtórzone pole formularza albo nazwy rozdzielone
+    przecinkami), max_differences - zakończ po tylu różnicach, stop_on_attribute -
+    zakończ po pierwszej różnicy w tym atrybucie. Porównanie trwa tyle, co żądanie, więc
+    endpoint wymaga wątkowych workerów gunicorna (gthread, jak w Procfile).
+    """
+    params = request.get_json(silent=True)
+    if params is None:
+        params = request.form
+        excluded_attributes = request.form.getlist('excluded_attributes')
+    elif isinstance(params, dict):
+        excluded_attributes = params.get('excluded_attributes') or []
+    else:
+        return jsonify({'error': 'Treść żądania musi być obiektem JSON'}), 400
+    feed1_url = (params.get('feed1') or '').strip()
+    feed2_url = (params.get('feed2') or '').strip()
+    if not feed1_url or not feed2_url:
+        return jsonify({'error': 'Parametry feed1 i feed2 są wymagane'}), 400
+
+    if isinstance(excluded_attributes, str):
+        excluded_attributes = [excluded_attributes]
+    if not isinstance(excluded_attributes, list) or not all(isinstance(attr, str) for attr in excluded_attributes):
+        return jsonify({'error': 'Parametr excluded_attributes musi być listą nazw atrybutów'}), 400
+    excluded_attributes = [attr.strip() for value in excluded_attributes for attr in value.split(',') if attr.strip()]
+    try:
+        max_differences = int(params.get('max_differences') or 0)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Parametr max_differences musi być liczbą'}), 400
+    if max_differences < 0:
+        return jsonify({'error': 'Parametr max_differences nie może być ujemny'}), 400
+    stop_on_attribute = params.get('stop_on_attribute') or None
+
+    def records():
+        # Nagłówek przed pobraniem feedów - klient od razu dostaje odpowiedź, a pobieranie
+        # i parsowanie dużych feedów nie przekracza limitu czasu oczekiwania na pierwszy bajt
+        yield header_record(feed1=feed1_url, feed2=feed2_url, excluded_attributes=excluded_attributes,
+                            max_differences=max_differences or None, stop_on_attribute=stop_on_attribute)
+        comparator = XMLFeedComparator(feed1_url, feed2_url)
+        comparison = comparator.stream_comparison(excluded_attributes, max_differences, stop_on_attribute)
+        if comparison is None:
+            yield error_record(comparator.last_error or "Nie udało się przetworzyć plików. Sprawdź adresy URL i format XML.")
+            return
+        yield from comparison
+
+    return Response(iter_ndjson_records(records(), batch_rows=1), mimetype='application/x-ndjson')
+
+def stored_job_result(job, target=None):
+    """Zapisany wynik zadania: StoredResult, StoredMultiResult (N-way bez target) albo None"""
+    if 'targets' in job['params'] and target is None:
+        return StoredMultiResult(job_result_path(job))
+    result_path = job_result_path(job, target)
+    return None if result_path is None else StoredResult(result_path)
+
 @app.route('/download_excel')
 def download_excel():
-    feed1_url = request.args.get('feed1')
-    feed2_url = request.args.get('feed2')
-    
-    # Pobierz wykluczone atrybuty z sesji
-    excluded_attributes = session.get('excluded_attributes', [])
+    job = job_manager.status(request.args.get('job'))
+    if job is not None and job['status'] == 'done':
+        # Raport z zapisanego wyniku zadania - bez ponownego pobierania i porównywania feedów
+        comparator = XMLFeedComparator(job['params'].get('feed1'), job['params'].get('feed2'))
+        excel_buffer = comparator.generate_excel_report(
+            job['params']['excluded_attributes'],
+            comparison_results=stored_job_result(job)
+        )
+    elif job is not None and job['status'] in ('queued', 'running'):
+        return redirect(url_for('job_progress', job_id=job['id']))
+    else:
+        feed1_url = request.args.get('feed1')
+        feed2_url = request.args.get('feed2')
+        
+        # Pobierz wykluczone atrybuty z sesji
+        excluded_attributes = session.get('excluded_attributes', [])
 
-    if not feed1_url or not feed2_url:
-        return "Brak adresów URL do wygenerowania raportu.", 400
+        if not feed1_url or not feed2_url:
+            return "Brak adresów URL do wygenerowania raportu.", 400
 
-    comparator = XMLFeedComparator(feed1_url, feed2_url)
-    excel_buffer = comparator.generate_excel_report(excluded_attributes)
+        precomputed = None if request.args.get('refresh') == '1' else precomputed_result(feed1_url, feed2_url, excluded_attributes)
+        if not precomputed:
+            # Bez gotowego wyniku porównanie idzie do kolejki zadań (jak /compare), a raport
+            # jest dostępny ze strony wyników - żądanie nie czeka na całe porównanie
+            job_id = job_manager.submit(
+                comparison_job_key(feed1_url, feed2_url, excluded_attributes),
+                {'feed1': feed1_url, 'feed2': feed2_url, 'excluded_attributes': excluded_attributes},
+                run_comparison_job, feed1_url, feed2_url, excluded_attributes
+            )
+            return redirect(url_for('job_progress', job_id=job_id))
+        comparator = XMLFeedComparator(feed1_url, feed2_url)
+        excel_buffer = comparator.generate_excel_report(
+            excluded_attributes,
+            comparison_results=StoredResult(job_manager.result_path(precomputed['id']))
+        )
 
     if excel_buffer is None:
         return "Błąd podczas generowania pliku Excel.", 500
@@ -441,6 +1736,47 @@ def download_excel():
         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
     )
 
+@app.route('/download/<export_format>')
+def download_export(export_format):
+    """Eksport wyniku zakończonego zadania: xlsx, csv, ndjson (strumieniowo) lub parquet"""
+    job = job_manager.status(request.args.get('job'))
+    if job is None or job['status'] != 'done':
+        return "Nie znaleziono zakończonego porównania.", 404
+
+    target = request.args.get('target', type=int)
+    result = stored_job_result(job, target)
+    if result is None:
+        return "Nie znaleziono wyniku dla wybranego feedu.", 404
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"porownanie_feedow_{timestamp}.{export_format}"
+
+    if isinstance(result, StoredMultiResult):
+        # Porównanie N-way: CSV to archiwum ZIP z plikiem na każdy feed docelowy
+        if export_format == 'csv':
+            return send_file(multi_csv_zip(result), as_attachment=True, download_name=f"porownanie_feedow_{timestamp}.zip", mimetype='application/zip')
+        if export_format != 'xlsx':
+            return f"Eksport {export_format} porównania N-way wymaga wskazania feedu docelowego (parametr target).", 400
+
+    if export_format == 'csv':
+        return Response(iter_csv(result), mimetype='text/csv', headers={'Content-Disposition': f'attachment; filename={filename}'})
+    if export_format == 'ndjson':
+        return Response(iter_ndjson(result), mimetype='application/x-ndjson', headers={'Content-Disposition': f'attachment; filename={filename}'})
+    if export_format == 'parquet':
+        parquet_buffer = parquet_file(result)
+        if parquet_buffer is None:
+            return "Eksport Parquet wymaga pakietu pyarrow (pip install pyarrow).", 501
+        return send_file(parquet_buffer, as_attachment=True, download_name=filename, mimetype='application/vnd.apache.parquet')
+    if export_format == 'xlsx':
+        with metrics.stage('excel'):
+            excel_buffer = xlsx_file(result)
+        return send_file(excel_buffer, as_attachment=True, download_name=filename, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    return f"Nieobsługiwany format eksportu: {export_format}", 400
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Metryki w formacie tekstowym Prometheus (suma ze wszystkich workerów)"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == "__main__":
     print(f"🚀 Starting Feed Comparator on port {Config.PORT}")
     print(f"   Environment: {Config.FLASK_ENV}")
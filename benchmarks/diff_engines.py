@@ -0,0 +1,86 @@
+"""
+Benchmark of the attribute diff engines used by XMLFeedComparator.compare_feeds.
+
+Builds two synthetic product maps in memory, runs every engine on them,
+checks that all engines return identical results and prints the timings.
+
+    python benchmarks/diff_engines.py --products 200000 --attributes 30
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import XMLFeedComparator  # noqa: E402
+
+ENGINES = ('python', 'pandas')
+
+
+def build_feeds(products, attributes, diff_ratio, missing_ratio, seed):
+    """Returns two product maps with the same IDs and a share of differing values."""
+    rng = random.Random(seed)
+    feed1, feed2 = {}, {}
+    for index in range(products):
+        product_id = f"SKU-{index:08d}"
+        prod1 = {'id': product_id}
+        for attr_index in range(attributes):
+            if rng.random() >= missing_ratio:
+                prod1[f"attr_{attr_index}"] = f"value {rng.randint(0, 50)}"
+        prod2 = dict(prod1)
+        if rng.random() < diff_ratio:
+            key = f"attr_{rng.randrange(attributes)}"
+            prod2[key] = f"changed {rng.randint(0, 50)}"
+        feed1[product_id] = prod1
+        feed2[product_id] = prod2
+    return feed1, feed2
+
+
+class _PreloadedComparator(XMLFeedComparator):
+    """Comparator working on in-memory product maps instead of downloading feeds."""
+
+    def __init__(self, feed1, feed2):
+        super().__init__('feed1', 'feed2')
+        self._preloaded = (feed1, feed2)
+
+    def _fetch_feeds(self):
+        return [b'', b'']
+
+    def _load_feeds(self, contents=None):
+        self.feed1_data, self.feed2_data = self._preloaded
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--attributes', type=int, default=30)
+    parser.add_argument('--diff-ratio', type=float, default=0.1)
+    parser.add_argument('--missing-ratio', type=float, default=0.05)
+    parser.add_argument('--exclude', action='append', default=[])
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    feed1, feed2 = build_feeds(args.products, args.attributes, args.diff_ratio, args.missing_ratio, args.seed)
+    comparator = _PreloadedComparator(feed1, feed2)
+
+    results = {}
+    for engine in ENGINES:
+        started = time.perf_counter()
+        results[engine] = comparator.compare_feeds(args.exclude, engine=engine, full_recompute=True)
+        elapsed = time.perf_counter() - started
+        print(f"{engine:>8}: {elapsed:8.3f} s  ({len(results[engine]['differences'])} differences)")
+
+    reference = results[ENGINES[0]]
+    for engine in ENGINES[1:]:
+        if results[engine] != reference:
+            print(f"ERROR: engine '{engine}' returned a different result than '{ENGINES[0]}'")
+            return 1
+    print("All engines returned identical results.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""
+Synthetic feed generator for benchmarks.
+
+Writes a pair of feeds in one of the layouts recognized by the parser:
+
+    rss      RSS 2.0 <item> with Google Merchant <g:id> and g: attributes
+    atom     Atom <entry> with <id>
+    offer    <offers><offer> with <id>
+    product  <products><product> with <sku>
+
+Feed 2 is derived from feed 1: diff_ratio of the common products have one
+changed attribute (some of them a missing one), only_ratio of all products
+exist in just one of the feeds (half in each). Output is deterministic for a
+given seed and streamed to disk, so millions of products need little memory.
+
+    python benchmarks/feedgen.py --products 1000000 --shape rss --out /tmp/feeds
+"""
+import argparse
+import os
+import random
+import sys
+from xml.sax.saxutils import escape
+
+SHAPES = {
+    'rss': (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<rss xmlns:g="http://base.google.com/ns/1.0" version="2.0"><channel><title>Benchmark</title>\n',
+        '</channel></rss>\n',
+        'item', 'g:id', 'g:',
+    ),
+    'atom': (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<feed xmlns="http://www.w3.org/2005/Atom"><title>Benchmark</title>\n',
+        '</feed>\n',
+        'entry', 'id', '',
+    ),
+    'offer': (
+        '<?xml version="1.0" encoding="UTF-8"?>\n<offers>\n',
+        '</offers>\n',
+        'offer', 'id', '',
+    ),
+    'product': (
+        '<?xml version="1.0" encoding="UTF-8"?>\n<products>\n',
+        '</products>\n',
+        'product', 'sku', '',
+    ),
+}
+
+# Wartości atrybutów o niskiej kardynalności, powtarzające się jak w prawdziwych feedach
+LOW_CARDINALITY = ['in stock', 'out of stock', 'new', 'PLN', 'EUR', 'Brand & Co', 'used', 'preorder']
+
+WRITE_BATCH = 1000
+
+
+def product_attributes(rng, index, attributes):
+    """Attribute values of one product: a title, a price and a mix of repeating and unique values."""
+    values = {'title': f"Product {index} <{rng.randint(0, 999)}>", 'price': f"{rng.randint(1, 99999) / 100:.2f} PLN"}
+    for attr_index in range(max(attributes - len(values), 0)):
+        if attr_index % 3 == 0:
+            values[f"attr_{attr_index}"] = f"value {index}-{attr_index}"
+        else:
+            values[f"attr_{attr_index}"] = rng.choice(LOW_CARDINALITY)
+    return values
+
+
+def render_product(shape, product_id, values):
+    _, _, tag, id_tag, prefix = SHAPES[shape]
+    parts = [f"<{tag}><{id_tag}>{escape(product_id)}</{id_tag}>"]
+    for name, value in values.items():
+        parts.append(f"<{prefix}{name}>{escape(value)}</{prefix}{name}>")
+    parts.append(f"</{tag}>\n")
+    return ''.join(parts)
+
+
+def generate_pair(path1, path2, products, attributes=20, shape='rss', diff_ratio=0.1, only_ratio=0.05, seed=1):
+    """
+    Writes two feeds with the given number of products per side and returns the
+    expected counts: {'common', 'only_in_feed1', 'only_in_feed2', 'changed'}.
+    """
+    header, footer, _, _, _ = SHAPES[shape]
+    rng = random.Random(seed)
+    expected = {'common': 0, 'only_in_feed1': 0, 'only_in_feed2': 0, 'changed': 0}
+    with open(path1, 'w', encoding='utf-8') as feed1, open(path2, 'w', encoding='utf-8') as feed2:
+        feed1.write(header)
+        feed2.write(header)
+        batch1, batch2 = [], []
+        for index in range(products):
+            product_id = f"P{index:09d}"
+            values = product_attributes(rng, index, attributes)
+            side = rng.random()
+            if side < only_ratio / 2:
+                batch1.append(render_product(shape, product_id, values))
+                expected['only_in_feed1'] += 1
+            elif side < only_ratio:
+                batch2.append(render_product(shape, product_id, values))
+                expected['only_in_feed2'] += 1
+            else:
+                batch1.append(render_product(shape, product_id, values))
+                if rng.random() < diff_ratio:
+                    values = dict(values)
+                    name = rng.choice(list(values))
+                    if rng.random() < 0.2:
+                        del values[name]
+                    else:
+                        values[name] = f"changed {rng.randint(0, 999)}"
+                    expected['changed'] += 1
+                batch2.append(render_product(shape, product_id, values))
+                expected['common'] += 1
+            if len(batch1) >= WRITE_BATCH or len(batch2) >= WRITE_BATCH:
+                feed1.write(''.join(batch1))
+                feed2.write(''.join(batch2))
+                batch1, batch2 = [], []
+        feed1.write(''.join(batch1))
+        feed2.write(''.join(batch2))
+        feed1.write(footer)
+        feed2.write(footer)
+    return expected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--attributes', type=int, default=20)
+    parser.add_argument('--shape', choices=sorted(SHAPES), default='rss')
+    parser.add_argument('--diff-ratio', type=float, default=0.1)
+    parser.add_argument('--only-ratio', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', default='.')
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    path1 = os.path.join(args.out, f"feed1-{args.shape}-{args.products}.xml")
+    path2 = os.path.join(args.out, f"feed2-{args.shape}-{args.products}.xml")
+    expected = generate_pair(path1, path2, args.products, args.attributes, args.shape, args.diff_ratio, args.only_ratio, args.seed)
+    print(f"{path1}\n{path2}\n{expected}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
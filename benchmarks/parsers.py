@@ -0,0 +1,196 @@
+"""
+Conformance check and benchmark of the streaming parser backends.
+
+First parses a set of edge-case documents (namespaces, CDATA, comments, mixed
+content, nested and duplicate products, entities, non-UTF-8 encodings,
+malformed XML) with every backend and checks that all of them return
+identical product maps in the same order, or fail with the same exception
+type. Documents split into shards for the parse pool (app.split_feed) must
+give the same products in the same order as a serial parse, and so must the
+parse pool itself (PARSE_WORKERS=2) for a feed given as bytes, as a cached
+blob (mmap with a path), as a mapped file without a path and gzip-compressed.
+Then generates a feed of every shape (benchmarks/feedgen.py), checks
+the same on it and prints the parse time of each backend.
+
+    python benchmarks/parsers.py --products 200000 --attributes 30
+
+Exit code 1 means that a backend returned a different result.
+"""
+import argparse
+import gzip
+import mmap
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+from app import XMLFeedComparator, shard_bytes, split_feed  # noqa: E402
+from config import Config  # noqa: E402
+from feed_cache import FeedCache  # noqa: E402
+from feed_parser import parse_shard  # noqa: E402
+from feedgen import SHAPES, generate_pair  # noqa: E402
+
+BACKENDS = ('etree', 'expat')
+
+CASES = {
+    'namespaces': b'<?xml version="1.0"?><rss xmlns:g="http://base.google.com/ns/1.0"><channel>'
+                  b'<item><g:id>1</g:id><g:price>10 PLN</g:price><title>A</title></item>'
+                  b'<item xmlns="urn:x"><id>2</id><G:Title xmlns:G="urn:y">B</G:Title></item></channel></rss>',
+    'text': b'<offers><offer><id> 1 </id><name><![CDATA[ <b>bold</b> & co ]]></name>'
+            b'<desc>a<!-- comment -->b &amp; &#233;</desc><empty/><blank>  \n </blank>'
+            b'<mixed>head<b>inner</b>tail</mixed></offer></offers>',
+    'nested': b'<products><product><sku>P1</sku><title>outer</title>'
+              b'<product><sku>P2</sku><title>inner</title><item><id>P3</id></item></product>'
+              b'<after>x</after></product><group><entry><id>P4</id></entry></group></products>',
+    'duplicates': b'<offers><offer><id>1</id><v>a</v></offer><offer><id>2</id></offer>'
+                  b'<offer><id>1</id><v>b</v><v>c</v></offer><offer><name>no id</name></offer>'
+                  b'<offer><id></id></offer><offer><sku>S</sku><id>I</id></offer></offers>',
+    'case': b'<Feed><ITEM><ID>1</ID><Title>x</Title></ITEM><Offer><Product_ID>2</Product_ID></Offer></Feed>',
+    'root_product': b'<product><id>only</id><name>root</name></product>',
+    'encoding': '<?xml version="1.0" encoding="windows-1250"?><offers><offer><id>1</id>'
+                '<name>Zażółć gęślą jaźń</name></offer></offers>'.encode('windows-1250'),
+    'utf16': '<offers><offer><id>1</id><name>łódź</name></offer></offers>'.encode('utf-16'),
+    'entity': b'<!DOCTYPE offers [<!ENTITY x "boom">]><offers><offer><id>&x;</id></offer></offers>',
+    'external': b'<!DOCTYPE offers [<!ENTITY x SYSTEM "file:///etc/passwd">]><offers><offer><id>&x;</id></offer></offers>',
+    'malformed': b'<offers><offer><id>1</id></offer><offer><id>2</offer></offers>',
+    'truncated': b'<offers><offer><id>1</id></offer><offer><id>2</id>',
+    'empty': b'',
+}
+
+# Dokumenty dzielone na shardy - SHARD_SIZE jest mniejszy niż jeden produkt, więc każdy
+# produkt wyznacza granicę
+SHARD_SIZE = 16
+SHARD_CASES = {
+    'split': b'<?xml version="1.0"?><rss><channel><title>t</title>'
+             b'<item><id>1</id><v>a</v></item><item><id>2</id></item><item><id>1</id><v>b</v></item>'
+             b'</channel></rss>',
+    'trailing_offer': b'<offers><item><id>1</id></item><item><id>2</id></item>'
+                      b'<offer><id>3</id></offer></offers>',
+    'trailing_empty': b'<offers><item><id>1</id></item><item><id>2</id></item><item/></offers>',
+}
+
+
+def parse(backend, content):
+    """Returns ('ok', list of products) or ('error', exception type name)."""
+    try:
+        return 'ok', list(XMLFeedComparator(None, None).iter_products(content, backend=backend))
+    except Exception as e:
+        return 'error', type(e).__name__
+
+
+def check_conformance(name, content):
+    results = {backend: parse(backend, content) for backend in BACKENDS}
+    reference = results[BACKENDS[0]]
+    for backend in BACKENDS[1:]:
+        if results[backend] != reference:
+            print(f"ERROR: {name}: '{backend}' returned {results[backend]!r}, '{BACKENDS[0]}' returned {reference!r}")
+            return False
+    return True
+
+
+def check_shards(name, content, shard_size=SHARD_SIZE):
+    """Products merged from split_feed shards must equal the serial parse, in order."""
+    serial = parse(BACKENDS[0], content)
+    if serial[0] == 'ok':
+        # Mapa produktów: powtórzone ID zostaje na pozycji pierwszego wystąpienia
+        serial = 'ok', list(dict(serial[1]).items())
+    merged = {}
+    try:
+        for ranges in split_feed(content, shard_size):
+            merged.update(parse_shard(shard_bytes(content, ranges)))
+        sharded = 'ok', list(merged.items())
+    except Exception as e:
+        sharded = 'error', type(e).__name__
+    if sharded != serial:
+        print(f"ERROR: {name}: shards returned {sharded!r}, serial parse returned {serial!r}")
+        return False
+    return True
+
+
+def check_pool(content, directory):
+    """
+    Parses content in the parse pool (sharded and as a single shard) in every form a
+    downloaded feed can take and compares the products with a serial parse.
+    """
+    serial = list(dict(XMLFeedComparator(None, None).iter_products(content)).items())
+    cache = FeedCache(os.path.join(directory, 'cache'), 1 << 40, 3600)
+    blob = cache.open(cache.store('http://example.com/feed.xml', [content], len(content)))
+    unnamed = tempfile.TemporaryFile()
+    unnamed.write(content)
+    unnamed.flush()
+    inputs = {
+        'bytes': lambda: content,
+        'cached blob': lambda: blob,
+        'mapped file': lambda: mmap.mmap(unnamed.fileno(), 0, access=mmap.ACCESS_READ),
+        'gzip': lambda: gzip.compress(content),
+    }
+    saved = Config.PARSE_WORKERS, Config.PARSE_SHARD_SIZE
+    Config.PARSE_WORKERS = 2
+    conforming = True
+    try:
+        for shard_size in (len(content) // 4, len(content)):
+            Config.PARSE_SHARD_SIZE = shard_size
+            for name, make_input in inputs.items():
+                comparator = XMLFeedComparator(None, None)
+                products = list(comparator.parse_xml_feed(make_input()).items())
+                if products != serial:
+                    print(f"ERROR: parse pool, {name}, shard size {shard_size}: {len(products)} products, serial parse: {len(serial)}")
+                    conforming = False
+    finally:
+        Config.PARSE_WORKERS, Config.PARSE_SHARD_SIZE = saved
+        unnamed.close()
+        if app.parse_pool is not None:
+            app.parse_pool.shutdown()
+            app.parse_pool = None
+    return conforming
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--attributes', type=int, default=20)
+    parser.add_argument('--shape', action='append', choices=sorted(SHAPES), help='default: all shapes')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    conforming = all([check_conformance(name, content) for name, content in CASES.items()])
+    print(f"Edge cases: {'identical' if conforming else 'DIFFERENT'} results from {', '.join(BACKENDS)}")
+    sharding = all([check_shards(name, content) for name, content in SHARD_CASES.items()])
+    print(f"Shards: {'identical' if sharding else 'DIFFERENT'} results from a serial parse")
+    conforming = conforming and sharding
+
+    with tempfile.TemporaryDirectory() as directory:
+        for shape in args.shape or sorted(SHAPES):
+            path = os.path.join(directory, f"{shape}.xml")
+            generate_pair(path, os.path.join(directory, 'unused.xml'), args.products, args.attributes, shape, seed=args.seed)
+            with open(path, 'rb') as f:
+                content = f.read()
+
+            if not check_pool(content, directory):
+                conforming = False
+
+            timings, products = {}, {}
+            for backend in BACKENDS:
+                started = time.perf_counter()
+                products[backend] = list(XMLFeedComparator(None, None).iter_products(content, backend=backend))
+                timings[backend] = time.perf_counter() - started
+            if any(products[backend] != products[BACKENDS[0]] for backend in BACKENDS[1:]):
+                print(f"ERROR: {shape}: backends returned different products")
+                conforming = False
+
+            reference = timings[BACKENDS[0]]
+            print(f"{shape:>8} ({len(products[BACKENDS[0]])} products, {len(content) / 1048576:.1f} MB): " + '  '.join(
+                f"{backend} {seconds:.3f} s ({reference / seconds:.2f}x)" for backend, seconds in timings.items()
+            ))
+
+    if not conforming:
+        return 1
+    print("All backends returned identical products.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
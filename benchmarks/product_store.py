@@ -0,0 +1,112 @@
+"""
+Memory benchmark of the product map representations used by XMLFeedComparator.
+
+Builds the same synthetic feed as a dict of dicts and as a ProductStore,
+measures the memory held by each (tracemalloc) and the time of a full
+find_differences pass, and checks that both give identical comparison results.
+
+    python benchmarks/product_store.py --products 500000 --attributes 30
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import XMLFeedComparator  # noqa: E402
+from product_store import ProductStore  # noqa: E402
+
+# Atrybuty o niskiej kardynalności, typowe dla feedów produktowych
+LOW_CARDINALITY = {
+    'currency': ['PLN', 'EUR'],
+    'availability': ['in stock', 'out of stock', 'preorder'],
+    'condition': ['new', 'used', 'refurbished'],
+    'brand': [f"Brand {index}" for index in range(200)],
+    'shipping': ['0.00 PLN', '9.99 PLN', '14.99 PLN'],
+}
+
+
+def iter_products(products, attributes, seed, diff_ratio=0.0):
+    """
+    Yields (product_id, attributes) pairs with unique, numeric and low-cardinality values.
+    With diff_ratio > 0 that share of products gets a changed price and availability.
+    """
+    rng = random.Random(seed)
+    changes = random.Random(seed + 1)
+    for index in range(products):
+        product_id = f"SKU-{index:08d}"
+        product = {
+            'id': product_id,
+            'title': f"Product {index} {rng.random():.6f}",
+            'link': f"https://shop.example.com/p/{index}",
+            'price': f"{rng.randint(1, 5000)}.{rng.randint(0, 99):02d} PLN",
+        }
+        for name, values in LOW_CARDINALITY.items():
+            product[name] = rng.choice(values)
+        for attr_index in range(max(attributes - len(product), 0)):
+            product[f"attr_{attr_index}"] = f"value {rng.randint(0, 20)}"
+        if diff_ratio and changes.random() < diff_ratio:
+            product['price'] = f"{changes.randint(1, 5000)}.00 PLN"
+            product['availability'] = 'out of stock'
+        yield product_id, product
+
+
+def measure(build):
+    """Returns (object, seconds, bytes allocated and still held) for build()."""
+    gc.collect()
+    started = time.perf_counter()
+    build()
+    elapsed = time.perf_counter() - started
+    # Drugie budowanie pod tracemalloc - śledzenie alokacji spowalnia, więc czas mierzony jest osobno
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, held
+
+
+def diff_pass(comparator, feed1, feed2):
+    started = time.perf_counter()
+    differences = []
+    for product_id in feed1:
+        differences.extend(comparator.find_differences(product_id, feed1[product_id], feed2[product_id]))
+    return differences, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=200000)
+    parser.add_argument('--attributes', type=int, default=30)
+    parser.add_argument('--diff-ratio', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    comparator = XMLFeedComparator('feed1', 'feed2')
+    representations = {
+        'dict': dict,
+        'store': ProductStore,
+    }
+    results = {}
+    for name, factory in representations.items():
+        feed1, build_time, held = measure(lambda: factory(iter_products(args.products, args.attributes, args.seed)))
+        feed2 = factory(iter_products(args.products, args.attributes, args.seed, args.diff_ratio))
+        differences, diff_time = diff_pass(comparator, feed1, feed2)
+        results[name] = differences
+        print(f"{name:>6}: {held / 1024 / 1024:9.1f} MB  {held / args.products:7.0f} B/product  "
+              f"build {build_time:6.2f} s  diff {diff_time:6.2f} s")
+        del feed1, feed2
+
+    if results['store'] != results['dict']:
+        print("ERROR: ProductStore returned different differences than dict")
+        return 1
+    print("Both representations returned identical differences.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
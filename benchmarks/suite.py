@@ -0,0 +1,202 @@
+"""
+Offline benchmark suite for the comparison pipeline.
+
+Generates a synthetic feed pair (benchmarks/feedgen.py), then measures every
+stage directly on XMLFeedComparator (read, parse, diff, Excel) and end to end
+through the Flask routes (/analyze, /compare job, paginated API, Excel
+download). Each stage reports seconds, throughput and the peak RSS of the
+process during the stage. Results are written as JSON; with --baseline the run
+fails (exit code 1) when a stage's throughput drops more than --threshold
+below the baseline.
+
+    python benchmarks/suite.py --products 100000 --shape rss --output bench.json
+    python benchmarks/suite.py --products 100000 --baseline bench.json --threshold 0.15
+
+Feeds are generated into --feeds-dir and reused by later runs with the same
+parameters. The feed cache and incremental comparison are disabled, so every
+run parses and compares from scratch.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Przed importem aplikacji: bez cache feedów, stan zadań i metryk w osobnym katalogu
+_WORK_DIR = tempfile.mkdtemp(prefix='feedcompare-bench-')
+os.environ['FEED_CACHE_MAX_SIZE'] = '0'
+os.environ['INCREMENTAL_COMPARE'] = 'False'
+os.environ.setdefault('JOBS_DIR', os.path.join(_WORK_DIR, 'jobs'))
+os.environ.setdefault('METRICS_DIR', os.path.join(_WORK_DIR, 'metrics'))
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+import app as feed_app  # noqa: E402
+from config import Config  # noqa: E402
+from feedgen import SHAPES, generate_pair  # noqa: E402
+from metrics import peak_rss, reset_peak_rss  # noqa: E402
+
+JOB_POLL_INTERVAL = 0.05
+
+
+def run_stage(results, name, unit, fn):
+    """Runs fn() (returning (value, processed items)), records the stage and returns value."""
+    reset_peak_rss()
+    started = time.perf_counter()
+    value, items = fn()
+    seconds = time.perf_counter() - started
+    results[name] = {
+        'seconds': round(seconds, 4),
+        'items': items,
+        'unit': unit,
+        'throughput': round(items / seconds, 2) if seconds else None,
+        'peak_rss_bytes': peak_rss(),
+    }
+    print(f"{name:<22} {seconds:9.3f} s  {results[name]['throughput'] or 0:14.0f} {unit}/s  "
+          f"peak RSS {results[name]['peak_rss_bytes'] / 1048576:8.1f} MB")
+    return value
+
+
+def direct_stages(results, path1, path2):
+    comparator = feed_app.XMLFeedComparator(path1, path2)
+
+    def read():
+        contents = [comparator._get_xml_content(path)[0] for path in (path1, path2)]
+        return contents, sum(len(content) for content in contents)
+    contents = run_stage(results, 'direct.read', 'bytes', read)
+
+    def parse():
+        comparator.feed1_data = comparator.parse_xml_feed(contents[0])
+        comparator.feed2_data = comparator.parse_xml_feed(contents[1])
+        return None, len(comparator.feed1_data) + len(comparator.feed2_data)
+    run_stage(results, 'direct.parse', 'products', parse)
+
+    # Porównanie na już sparsowanych danych - bez ponownego pobierania i parsowania
+    comparator._fetch_feeds = lambda: [b'', b'']
+    comparator._load_feeds = lambda contents=None: None
+
+    def diff():
+        comparison = comparator.compare_feeds([])
+        return comparison, comparison['common_total']
+    comparison = run_stage(results, 'direct.diff', 'products', diff)
+
+    def excel():
+        report = comparator.generate_excel_report(comparison_results=comparison)
+        report.close()
+        return None, len(comparison['differences'])
+    run_stage(results, 'direct.excel', 'rows', excel)
+    return comparison
+
+
+def flask_stages(results, path1, path2, comparison):
+    client = feed_app.app.test_client()
+    total_products = comparison['total_feed1'] + comparison['total_feed2']
+
+    def analyze():
+        response = client.post('/analyze', data={'feed1': path1, 'feed2': path2})
+        assert response.status_code == 200, response.status_code
+        return None, 1
+    run_stage(results, 'flask.analyze', 'requests', analyze)
+
+    def compare():
+        response = client.post('/compare', data={'feed1': path1, 'feed2': path2})
+        job_id = response.headers['Location'].rsplit('/', 1)[1]
+        while True:
+            status = client.get(f'/jobs/{job_id}/status').get_json()
+            if status['status'] not in ('queued', 'running'):
+                break
+            time.sleep(JOB_POLL_INTERVAL)
+        assert status['status'] == 'done', status
+        return job_id, total_products
+    job_id = run_stage(results, 'flask.compare', 'products', compare)
+
+    def results_page():
+        response = client.get(f'/results/{job_id}')
+        assert response.status_code == 200, response.status_code
+        page = client.get(f'/api/results/{job_id}/differences?per_page=1000&sort=attribute')
+        return None, len(page.get_json()['differences'])
+    run_stage(results, 'flask.results', 'rows', results_page)
+
+    def excel():
+        response = client.get(f'/download_excel?job={job_id}')
+        assert response.status_code == 200, response.status_code
+        response.get_data()
+        return None, len(comparison['differences'])
+    run_stage(results, 'flask.excel', 'rows', excel)
+
+
+def check_regressions(results, baseline, threshold):
+    """Returns the stages whose throughput is more than threshold below the baseline."""
+    regressions = []
+    for name, stage in results['stages'].items():
+        previous = baseline.get('stages', {}).get(name)
+        if not previous or not previous.get('throughput') or not stage['throughput']:
+            continue
+        change = stage['throughput'] / previous['throughput'] - 1
+        if change < -threshold:
+            regressions.append(f"{name}: {previous['throughput']} -> {stage['throughput']} {stage['unit']}/s ({change:+.1%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--attributes', type=int, default=20)
+    parser.add_argument('--shape', choices=sorted(SHAPES), default='rss')
+    parser.add_argument('--diff-ratio', type=float, default=0.1)
+    parser.add_argument('--only-ratio', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--feeds-dir', default=os.path.join(tempfile.gettempdir(), 'feedcompare_bench_feeds'))
+    parser.add_argument('--skip-flask', action='store_true', help='measure only the direct stages')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='JSON results of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed throughput drop vs the baseline (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    params = {key: getattr(args, key) for key in ('products', 'attributes', 'shape', 'diff_ratio', 'only_ratio', 'seed')}
+    os.makedirs(args.feeds_dir, exist_ok=True)
+    name = '-'.join(str(value) for value in params.values())
+    path1 = os.path.join(args.feeds_dir, f"feed1-{name}.xml")
+    path2 = os.path.join(args.feeds_dir, f"feed2-{name}.xml")
+    if not (os.path.exists(path1) and os.path.exists(path2)):
+        print(f"Generating {args.products} products ({args.shape}) into {args.feeds_dir} ...")
+        generate_pair(path1, path2, args.products, args.attributes, args.shape, args.diff_ratio, args.only_ratio, args.seed)
+
+    results = {
+        'params': params,
+        'config': {'diff_engine': Config.DIFF_ENGINE, 'parse_workers': Config.PARSE_WORKERS,
+                   'compact_product_store': Config.COMPACT_PRODUCT_STORE, 'streaming_parse': Config.STREAMING_PARSE},
+        'python': platform.python_version(),
+        'feed_bytes': os.path.getsize(path1) + os.path.getsize(path2),
+        'stages': {},
+    }
+    comparison = direct_stages(results['stages'], path1, path2)
+    if not args.skip_flask:
+        flask_stages(results['stages'], path1, path2, comparison)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('params') != params:
+            print("WARNING: baseline was measured with different parameters")
+        regressions = check_regressions(results, baseline, args.threshold)
+        if regressions:
+            print("Throughput regressions:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"No stage is more than {args.threshold:.0%} slower than the baseline.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""
+Transparent decompression of gzip, bzip2 and zstd feeds.
+
+Compressed feeds are recognized by their magic bytes, never by the file name
+or Content-Type, so a `.xml.gz` export, a gzip Content-Encoding kept as-is from
+the wire and a zstd dump all go through the same path. Decompression is a
+stream: the parser reads decompressed XML in small blocks and the compressed
+content is never expanded in memory.
+
+Every decompressed stream has a size limit; reading past it raises
+DecompressedSizeError, so a decompression bomb stops after `limit` bytes of
+output regardless of its compression ratio. estimated_size() tells the
+decompressed size from the file headers where possible, without decompressing.
+zstd needs the optional `zstandard` package.
+"""
+import bz2
+import gzip
+import io
+import mmap
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zależność opcjonalna
+    zstandard = None
+
+# Sygnatury formatów: gzip (RFC 1952), bzip2, ramka zstd
+MAGIC = (
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+)
+MAGIC_LENGTH = 4
+
+READ_BLOCK = 1024 * 1024
+
+# Zachowawczy współczynnik kompresji XML, gdy rozmiar po rozpakowaniu nie jest zapisany w pliku
+ESTIMATED_RATIO = 20
+# Najmniejszy plik gzip (nagłówek + stopka) i najdłuższy nagłówek ramki zstd
+GZIP_MIN_SIZE = 18
+ZSTD_MAX_HEADER = 18
+
+# Ile warstw kompresji rozpakować (np. plik .xml.bz2 wysłany z Content-Encoding gzip)
+MAX_LAYERS = 2
+
+
+class DecompressionError(ValueError):
+    """Compressed content is corrupt or its format is not supported."""
+
+
+class DecompressedSizeError(DecompressionError):
+    """Decompressed content exceeded the size limit."""
+
+    def __init__(self, limit):
+        super().__init__(f"decompressed content exceeds {limit} bytes")
+        self.limit = limit
+
+
+def detect_compression(head):
+    """Returns 'gzip', 'bz2' or 'zstd' for the first bytes of a feed, None for uncompressed content."""
+    for magic, name in MAGIC:
+        if head[:len(magic)] == magic:
+            return name
+    return None
+
+
+class _PrefixedReader:
+    """Non-seekable stream with already consumed leading bytes put back in front."""
+
+    def __init__(self, prefix, stream):
+        self.prefix = prefix
+        self.stream = stream
+
+    def read(self, size=-1):
+        if not self.prefix:
+            return self.stream.read(size)
+        if size is None or size < 0:
+            data, self.prefix = self.prefix + self.stream.read(), b''
+            return data
+        data, self.prefix = self.prefix[:size], self.prefix[size:]
+        if len(data) < size:
+            data += self.stream.read(size - len(data))
+        return data
+
+
+class LimitedReader:
+    """Decompressing stream that fails once more than limit bytes have been produced."""
+
+    def __init__(self, stream, limit):
+        self.stream = stream
+        self.limit = limit
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        if size == 0:
+            return b''
+        if size is None or size < 0:
+            size = self.limit + 1 - self.bytes_read
+        # Nigdy nie prosimy o więcej niż limit + 1 bajt - bomba nie rozpakuje się w pamięci
+        size = min(size, self.limit + 1 - self.bytes_read)
+        try:
+            data = self.stream.read(max(size, 1))
+        except (OSError, EOFError, zlib.error) as e:
+            raise DecompressionError(str(e)) from e
+        except Exception as e:
+            if zstandard is not None and isinstance(e, zstandard.ZstdError):
+                raise DecompressionError(str(e)) from e
+            raise
+        self.bytes_read += len(data)
+        if self.bytes_read > self.limit:
+            raise DecompressedSizeError(self.limit)
+        return data
+
+    def close(self):
+        self.stream.close()
+
+
+def _peek(content):
+    """Returns (first bytes, stream positioned at the start of the content) for bytes, mmap or a file."""
+    if isinstance(content, (bytes, bytearray)):
+        return bytes(content[:MAGIC_LENGTH]), io.BytesIO(content)
+    if isinstance(content, mmap.mmap):
+        content.seek(0)
+        return content[:MAGIC_LENGTH], content
+    if getattr(content, 'seekable', lambda: False)():
+        position = content.tell()
+        head = content.read(MAGIC_LENGTH)
+        content.seek(position)
+        return head, content
+    head = content.read(MAGIC_LENGTH)
+    return head, _PrefixedReader(head, content)
+
+
+def _decompressor(name, stream):
+    if name == 'gzip':
+        return gzip.GzipFile(fileobj=stream, mode='rb')
+    if name == 'bz2':
+        return bz2.BZ2File(stream, mode='rb')
+    if zstandard is None:
+        raise DecompressionError("zstd-compressed feeds need the 'zstandard' package")
+    return zstandard.ZstdDecompressor().stream_reader(stream, read_across_frames=True)
+
+
+def is_compressed(content):
+    """True when bytes, an mmap or a seekable file holds gzip, bz2 or zstd content."""
+    if isinstance(content, (bytes, bytearray, mmap.mmap)):
+        return detect_compression(bytes(content[:MAGIC_LENGTH])) is not None
+    position = content.tell()
+    head = content.read(MAGIC_LENGTH)
+    content.seek(position)
+    return detect_compression(head) is not None
+
+
+def open_feed(content, limit):
+    """
+    Returns content unchanged when it is not compressed, otherwise a read-only
+    stream of the decompressed bytes limited to limit bytes (nested layers such
+    as gzip transfer encoding over a bz2 file are unwrapped). Accepts bytes, an
+    mmap or a binary file-like object (a non-seekable one loses its first bytes
+    to detection, so the returned stream must be used instead).
+    """
+    head, stream = _peek(content)
+    name = detect_compression(head)
+    if name is None:
+        return stream if isinstance(stream, _PrefixedReader) else content
+    for _ in range(MAX_LAYERS - 1):
+        head, inner = _peek(LimitedReader(_decompressor(name, stream), limit))
+        inner_name = detect_compression(head)
+        if inner_name is None:
+            return LimitedReader(inner, limit)
+        name, stream = inner_name, inner
+    return LimitedReader(_decompressor(name, stream), limit)
+
+
+def _slice(content, start, size):
+    """size bytes at start (negative: from the end) of bytes, an mmap or a seekable file (position restored)."""
+    if isinstance(content, (bytes, bytearray, mmap.mmap)):
+        return bytes(content[start:start + size or None])
+    position = content.tell()
+    content.seek(start, io.SEEK_END if start < 0 else io.SEEK_SET)
+    data = content.read(size)
+    content.seek(position)
+    return data
+
+
+def _length(content):
+    if isinstance(content, (bytes, bytearray, mmap.mmap)):
+        return len(content)
+    position = content.tell()
+    length = content.seek(0, io.SEEK_END)
+    content.seek(position)
+    return length
+
+
+def estimated_size(content):
+    """
+    Decompressed size of compressed content estimated without decompressing it;
+    None for uncompressed content. Uses the gzip ISIZE trailer (exact for a
+    single-member file below 4 GB) or the zstd frame content size when present,
+    otherwise ESTIMATED_RATIO times the compressed size; a nested compressed
+    layer is multiplied by ESTIMATED_RATIO once more. The estimate only chooses
+    a processing mode - the size limit is still enforced while decompressing.
+    Accepts bytes, an mmap or a seekable file.
+    """
+    name = detect_compression(_slice(content, 0, MAGIC_LENGTH))
+    if name is None:
+        return None
+    compressed = _length(content)
+    size = None
+    if name == 'gzip' and compressed >= GZIP_MIN_SIZE:
+        # ISIZE: rozmiar po rozpakowaniu modulo 2^32; mniejszy niż skompresowany oznacza wiele członów lub > 4 GB
+        size = int.from_bytes(_slice(content, -4, 4), 'little')
+        if size < compressed:
+            size = None
+    elif name == 'zstd' and zstandard is not None:
+        try:
+            frame_size = zstandard.frame_content_size(_slice(content, 0, ZSTD_MAX_HEADER))
+        except zstandard.ZstdError:
+            frame_size = -1
+        size = frame_size if frame_size > 0 else None
+    if size is None:
+        size = compressed * ESTIMATED_RATIO
+
+    # Zagnieżdżona warstwa (np. plik .bz2 wysłany z Content-Encoding gzip) - tylko pierwsze bajty
+    position = None if isinstance(content, (bytes, bytearray)) else content.tell()
+    try:
+        if position is not None:
+            content.seek(0)
+        _, stream = _peek(content)
+        inner_head = LimitedReader(_decompressor(name, stream), MAGIC_LENGTH).read(MAGIC_LENGTH)
+    finally:
+        if position is not None:
+            content.seek(position)
+    if detect_compression(inner_head) is not None:
+        size *= ESTIMATED_RATIO
+    return size
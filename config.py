@@ -3,6 +3,7 @@ Configuration module for Feed Comparator application.
 Loads settings from environment variables with sensible defaults.
 """
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -21,9 +22,87 @@ class Config:
     
     # Maximum XML file size in bytes (default: 2GB)
     MAX_XML_SIZE = int(os.getenv('MAX_XML_SIZE', 2147483648))
+
+    # Maximum size of a gzip/bz2/zstd feed after decompression, in bytes (default: 2GB);
+    # MAX_XML_SIZE then limits the compressed bytes
+    MAX_DECOMPRESSED_SIZE = int(os.getenv('MAX_DECOMPRESSED_SIZE', 2147483648))
     
     # Request timeout in seconds for fetching XML feeds
     REQUEST_TIMEOUT = int(os.getenv('REQUEST_TIMEOUT', 30))
+
+    # Chunk size in bytes used when streaming feed downloads
+    DOWNLOAD_CHUNK_SIZE = int(os.getenv('DOWNLOAD_CHUNK_SIZE', 1048576))
+
+    # On-disk feed cache shared by all workers (FEED_CACHE_MAX_SIZE=0 disables it)
+    FEED_CACHE_DIR = os.getenv('FEED_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'feedcompare_cache')
+    FEED_CACHE_MAX_SIZE = int(os.getenv('FEED_CACHE_MAX_SIZE', 5368709120))
+    
+    # Seconds a cached feed is served without revalidation (ETag/Last-Modified)
+    FEED_CACHE_TTL = int(os.getenv('FEED_CACHE_TTL', 300))
+
+    # Parse feeds incrementally (iterparse) instead of building the full XML tree
+    STREAMING_PARSE = os.getenv('STREAMING_PARSE', 'True').lower() in ('true', '1', 'yes')
+    
+    # Parse feeds in a pool of PARSE_WORKERS processes (0 = in the request process);
+    # feeds larger than PARSE_SHARD_SIZE bytes are split into shards parsed in parallel
+    PARSE_WORKERS = int(os.getenv('PARSE_WORKERS', 0))
+    PARSE_SHARD_SIZE = int(os.getenv('PARSE_SHARD_SIZE', 67108864))
+    
+    # Streaming parser backend: 'etree' (defusedxml iterparse) or 'expat'
+    # (builds products from parser events without creating Element objects)
+    PARSER_BACKEND = os.getenv('PARSER_BACKEND', 'etree')
+    
+    # Keep parsed products in the compact ProductStore (shared attribute layouts,
+    # tuple rows, interned values) instead of one dict per product
+    COMPACT_PRODUCT_STORE = os.getenv('COMPACT_PRODUCT_STORE', 'True').lower() in ('true', '1', 'yes')
+    
+    # /analyze reads only the first SNIFF_PRODUCTS products of each feed (attribute
+    # list and estimated product counts); 0 downloads and parses whole feeds
+    SNIFF_PRODUCTS = int(os.getenv('SNIFF_PRODUCTS', 1000))
+    
+    # Attribute diff engine: 'python' (per product) or 'pandas' (vectorized, column-wise)
+    DIFF_ENGINE = os.getenv('DIFF_ENGINE', 'python')
+    
+    # Re-compare only products whose fingerprint changed since the previous
+    # comparison of the same feed pair (state is kept in the feed cache);
+    # fingerprints are computed at parse time and stored next to the snapshot
+    INCREMENTAL_COMPARE = os.getenv('INCREMENTAL_COMPARE', 'False').lower() in ('true', '1', 'yes')
+    
+    # Feeds larger than this many bytes are compared out of core: products are
+    # sorted by ID into on-disk runs of EXTERNAL_SORT_RUN_SIZE products and
+    # merge-joined (0 disables; EXTERNAL_SORT_DIR defaults to the system temp dir)
+    EXTERNAL_COMPARE_THRESHOLD = int(os.getenv('EXTERNAL_COMPARE_THRESHOLD', 536870912))
+    EXTERNAL_SORT_RUN_SIZE = int(os.getenv('EXTERNAL_SORT_RUN_SIZE', 100000))
+    EXTERNAL_SORT_DIR = os.getenv('EXTERNAL_SORT_DIR') or None
+    
+    # Background comparison jobs: state/result directory shared by all workers,
+    # number of concurrent comparisons per worker and result retention in seconds
+    JOBS_DIR = os.getenv('JOBS_DIR') or os.path.join(tempfile.gettempdir(), 'feedcompare_jobs')
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', 1))
+    JOB_RESULT_TTL = int(os.getenv('JOB_RESULT_TTL', 86400))
+
+    # N-way comparison: target feeds downloaded, parsed and compared at once,
+    # and the maximum number of target feeds in one comparison
+    MULTI_COMPARE_WORKERS = int(os.getenv('MULTI_COMPARE_WORKERS', 4))
+    MAX_TARGET_FEEDS = int(os.getenv('MAX_TARGET_FEEDS', 20))
+
+    # Scheduled comparisons: JSON file with registered feed pairs (empty = disabled),
+    # refresh interval in seconds and the number of scheduled comparisons run at once
+    SCHEDULED_COMPARISONS_FILE = os.getenv('SCHEDULED_COMPARISONS_FILE', '')
+    SCHEDULE_INTERVAL = int(os.getenv('SCHEDULE_INTERVAL', 3600))
+    SCHEDULER_WORKERS = int(os.getenv('SCHEDULER_WORKERS', 1))
+    
+    # Metrics shared by all workers for /metrics (one file per process)
+    METRICS_DIR = os.getenv('METRICS_DIR') or os.path.join(tempfile.gettempdir(), 'feedcompare_metrics')
+    
+    # Log level; per-product difference logs are DEBUG and only every
+    # LOG_SAMPLE_EVERY-th product with differences is logged
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+    LOG_SAMPLE_EVERY = int(os.getenv('LOG_SAMPLE_EVERY', 1000))
+    
+    # Directory for cProfile dumps of comparisons submitted with profile=1
+    # (empty disables profiling)
+    PROFILE_DIR = os.getenv('PROFILE_DIR', '')
     
     # Flask environment (development/production)
     FLASK_ENV = os.getenv('FLASK_ENV', 'development')
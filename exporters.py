@@ -0,0 +1,309 @@
+"""
+Streaming exports of comparison results.
+
+Every exporter reads a result through the same small interface (summary dict,
+iter_only_in(feed), iter_differences()) implemented by results_store.StoredResult
+for finished jobs and by InMemoryResult for a compare_feeds dictionary, so rows
+are produced one at a time and never copied into intermediate DataFrames.
+
+- XLSX is written row by row with openpyxl write-only mode into a temporary
+  file; sheets longer than Excel's row limit are split automatically.
+- CSV and NDJSON are generators of text chunks, suitable for a streamed
+  response that starts before all rows are produced. The NDJSON record
+  helpers are shared with the streamed comparison of /api/compare.
+- Parquet needs the optional pyarrow package and is written in row groups.
+
+N-way results (one baseline against many targets) add iter_matrix() and
+target(index); their XLSX report has one differences sheet per target and the
+CSV export is a ZIP archive with one file per target.
+"""
+import csv
+import io
+import json
+import tempfile
+import zipfile
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Excel: 1 048 576 wierszy na arkusz, jeden zajmuje nagłówek
+EXCEL_MAX_DATA_ROWS = 1048576 - 1
+
+DIFFERENCE_COLUMNS = ['Product ID', 'Pole', 'Wartość Feed 1', 'Wartość Feed 2']
+# Arkusze różnic porównania N-way: Feed 1 to feed bazowy, Feed 2 to feed docelowy
+TARGET_DIFFERENCE_COLUMNS = ['Product ID', 'Pole', 'Wartość w feedzie bazowym', 'Wartość w feedzie']
+MULTI_SUMMARY_COLUMNS = ['Feed', 'URL', 'Produkty', 'Tylko w feedzie bazowym', 'Tylko w feedzie', 'Produkty wspólne', 'Produkty z różnicami', 'Błąd']
+
+# Liczba wierszy zbieranych w jedną porcję strumienia CSV/NDJSON i grupę wierszy Parquet
+STREAM_BATCH_ROWS = 1000
+PARQUET_ROW_GROUP = 100000
+
+
+class InMemoryResult:
+    """Exporter interface over a dictionary returned by compare_feeds."""
+
+    def __init__(self, results):
+        self.results = results
+        self.summary = {key: value for key, value in results.items() if key not in ('only_in_feed1', 'only_in_feed2', 'differences')}
+        self.summary['only_in_feed1_total'] = len(results['only_in_feed1'])
+        self.summary['only_in_feed2_total'] = len(results['only_in_feed2'])
+        self.summary['differences_total'] = len(results['differences'])
+
+    def iter_only_in(self, feed):
+        return iter(self.results[f'only_in_feed{feed}'])
+
+    def iter_differences(self):
+        return ((d['Product ID'], d['Pole'], d['Wartość Feed 1'], d['Wartość Feed 2']) for d in self.results['differences'])
+
+
+class InMemoryMultiResult:
+    """Exporter interface over a dictionary returned by MultiFeedComparator.compare."""
+
+    def __init__(self, results):
+        self.results = results
+        self.summary = {
+            'baseline': results['baseline'],
+            'total_baseline': results['total_baseline'],
+            'matrix_total': len(results['matrix']),
+            'targets': [
+                {'feed': entry['feed'], 'error': entry['error'],
+                 'summary': None if entry['result'] is None else InMemoryResult(entry['result']).summary}
+                for entry in results['targets']
+            ],
+        }
+
+    def iter_matrix(self, limit=None):
+        return iter(self.results['matrix'][:limit])
+
+    def target(self, index):
+        result = self.results['targets'][index - 1]['result']
+        return None if result is None else InMemoryResult(result)
+
+
+def target_label(index):
+    """Name of target number index (from 1) in N-way reports."""
+    return f"Feed {index}"
+
+
+def summary_rows(summary):
+    """Rows of the 'Podsumowanie' sheet: (metric, value)."""
+    return [
+        ('Produkty w Feed 1', summary['total_feed1']),
+        ('Produkty w Feed 2', summary['total_feed2']),
+        ('Produkty tylko w Feed 1', summary['only_in_feed1_total']),
+        ('Produkty tylko w Feed 2', summary['only_in_feed2_total']),
+        ('Produkty wspólne', summary['common_total']),
+        ('Produkty z różnicami', summary['diff_products_total']),
+    ]
+
+
+def attribute_stats_rows(summary):
+    """Rows of the 'Statystyki atrybutów' sheet: (attribute, count, percentage of common products)."""
+    common_total = summary['common_total']
+    for stat in summary['attribute_stats']:
+        percentage = (stat['count'] / common_total * 100) if common_total > 0 else 0
+        yield stat['attribute'], stat['count'], round(percentage, 1)
+
+
+def _write_sheets(workbook, title, header, rows):
+    """Writes rows to as many sheets as needed: 'title', 'title (2)', ..."""
+    bold = Font(bold=True)
+    sheet = None
+    sheet_rows = EXCEL_MAX_DATA_ROWS
+    sheet_number = 0
+    for row in rows:
+        if sheet_rows == EXCEL_MAX_DATA_ROWS:
+            sheet_number += 1
+            sheet = workbook.create_sheet(title if sheet_number == 1 else f"{title} ({sheet_number})")
+            header_cells = []
+            for name in header:
+                cell = WriteOnlyCell(sheet, value=name)
+                cell.font = bold
+                header_cells.append(cell)
+            sheet.append(header_cells)
+            sheet_rows = 0
+        sheet.append(row)
+        sheet_rows += 1
+
+
+def write_xlsx(result, output):
+    """Writes the Excel report (same sheets as before) to a path or binary file object."""
+    workbook = Workbook(write_only=True)
+    summary = result.summary
+    _write_sheets(workbook, 'Podsumowanie', ['Metryka', 'Wartość'], summary_rows(summary))
+    if summary.get('attribute_stats'):
+        _write_sheets(workbook, 'Statystyki atrybutów', ['Atrybut', 'Liczba różnic', 'Procent produktów (%)'], attribute_stats_rows(summary))
+    if summary['only_in_feed1_total']:
+        _write_sheets(workbook, 'Tylko w Feed 1', ['Product ID'], ((product_id,) for product_id in result.iter_only_in(1)))
+    if summary['only_in_feed2_total']:
+        _write_sheets(workbook, 'Tylko w Feed 2', ['Product ID'], ((product_id,) for product_id in result.iter_only_in(2)))
+    if summary['differences_total']:
+        _write_sheets(workbook, 'Szczegółowe Różnice', DIFFERENCE_COLUMNS, result.iter_differences())
+    workbook.save(output)
+
+
+def xlsx_file(result):
+    """Returns the Excel report as an anonymous temporary file positioned at the start."""
+    output = tempfile.TemporaryFile()
+    if hasattr(result, 'iter_matrix'):
+        write_multi_xlsx(result, output)
+    else:
+        write_xlsx(result, output)
+    output.seek(0)
+    return output
+
+
+def multi_summary_rows(summary):
+    """Rows of the N-way 'Podsumowanie' sheet: the baseline, then one row per target."""
+    yield 'Feed bazowy', summary['baseline'], summary['total_baseline'], None, None, None, None, None
+    for index, target in enumerate(summary['targets'], 1):
+        counts = target['summary']
+        if counts is None:
+            yield target_label(index), target['feed'], None, None, None, None, None, target['error']
+            continue
+        yield (target_label(index), target['feed'], counts['total_feed2'], counts['only_in_feed1_total'],
+               counts['only_in_feed2_total'], counts['common_total'], counts['diff_products_total'], None)
+
+
+def write_multi_xlsx(result, output):
+    """Writes the N-way Excel report: summary, per-target attribute stats, the matrix and one sheet per target."""
+    workbook = Workbook(write_only=True)
+    summary = result.summary
+    labels = [target_label(index) for index in range(1, len(summary['targets']) + 1)]
+    _write_sheets(workbook, 'Podsumowanie', MULTI_SUMMARY_COLUMNS, multi_summary_rows(summary))
+    _write_sheets(workbook, 'Statystyki atrybutów', ['Feed', 'Atrybut', 'Liczba różnic', 'Procent produktów (%)'], (
+        (label,) + row
+        for label, target in zip(labels, summary['targets']) if target['summary']
+        for row in attribute_stats_rows(target['summary'])
+    ))
+    if summary['matrix_total']:
+        _write_sheets(workbook, 'Macierz różnic', ['Product ID'] + labels, (
+            [product_id] + cells for product_id, cells in result.iter_matrix()
+        ))
+    for index, (label, target) in enumerate(zip(labels, summary['targets']), 1):
+        if target['summary'] and target['summary']['differences_total']:
+            _write_sheets(workbook, label, TARGET_DIFFERENCE_COLUMNS, result.target(index).iter_differences())
+    workbook.save(output)
+
+
+def multi_csv_zip(result):
+    """
+    Returns a ZIP archive (temporary file positioned at the start) with the N-way
+    summary, the matrix and the differences of every target as separate CSV files.
+    """
+    summary = result.summary
+    labels = [target_label(index) for index in range(1, len(summary['targets']) + 1)]
+    output = tempfile.TemporaryFile()
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        files = [
+            ('podsumowanie.csv', iter_csv_rows(MULTI_SUMMARY_COLUMNS, multi_summary_rows(summary))),
+            ('macierz.csv', iter_csv_rows(['Product ID'] + labels, ([product_id] + cells for product_id, cells in result.iter_matrix()))),
+        ]
+        for index, target in enumerate(summary['targets'], 1):
+            if target['summary']:
+                files.append((f"feed_{index}.csv", iter_csv_rows(TARGET_DIFFERENCE_COLUMNS, result.target(index).iter_differences())))
+        for name, chunks in files:
+            with archive.open(name, 'w') as f:
+                for chunk in chunks:
+                    f.write(chunk.encode('utf-8'))
+    output.seek(0)
+    return output
+
+
+def iter_csv(result):
+    """Streams the differences table as CSV (UTF-8 with BOM so Excel detects the encoding)."""
+    return iter_csv_rows(DIFFERENCE_COLUMNS, result.iter_differences())
+
+
+def iter_csv_rows(header, rows):
+    """Streams a header and rows as CSV text chunks (UTF-8 with BOM)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(header)
+    for index, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if index % STREAM_BATCH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def only_in_record(feed, product_id):
+    return {'type': 'only_in', 'feed': feed, 'product_id': product_id}
+
+
+def difference_record(product_id, attribute, value1, value2):
+    return {'type': 'difference', 'product_id': product_id, 'attribute': attribute, 'feed1': value1, 'feed2': value2}
+
+
+def summary_record(summary):
+    return dict({'type': 'summary'}, **summary)
+
+
+def header_record(**params):
+    return dict({'type': 'header'}, **params)
+
+
+def error_record(message):
+    return {'type': 'error', 'error': message}
+
+
+def iter_ndjson(result):
+    """Streams only-in records, difference records and finally the summary record, one JSON per line."""
+    def records():
+        for feed in (1, 2):
+            for product_id in result.iter_only_in(feed):
+                yield only_in_record(feed, product_id)
+        for row in result.iter_differences():
+            yield difference_record(*row)
+        yield summary_record(result.summary)
+
+    return iter_ndjson_records(records())
+
+
+def iter_ndjson_records(records, batch_rows=STREAM_BATCH_ROWS):
+    """
+    Encodes an iterable of records as NDJSON text chunks of up to batch_rows lines.
+    batch_rows=1 sends every record as soon as it is produced - for slowly produced
+    records, like the streamed comparison, where the client reads them as they come.
+    """
+    lines = []
+    for record in records:
+        lines.append(json.dumps(record, ensure_ascii=False))
+        if len(lines) >= batch_rows:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def parquet_file(result):
+    """
+    Returns the differences table as a Parquet temporary file positioned at the start,
+    or None when pyarrow is not installed.
+    """
+    if pq is None:
+        return None
+    schema = pa.schema([(name, pa.string()) for name in DIFFERENCE_COLUMNS])
+    output = tempfile.TemporaryFile()
+    with pq.ParquetWriter(output, schema) as writer:
+        batch = []
+        for row in result.iter_differences():
+            batch.append(row)
+            if len(batch) == PARQUET_ROW_GROUP:
+                writer.write_table(pa.Table.from_pylist([dict(zip(DIFFERENCE_COLUMNS, r)) for r in batch], schema=schema))
+                batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist([dict(zip(DIFFERENCE_COLUMNS, r)) for r in batch], schema=schema))
+    output.seek(0)
+    return output
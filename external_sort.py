@@ -0,0 +1,84 @@
+"""
+External (out-of-core) sort-merge used to compare feeds larger than RAM.
+
+Products of a feed are buffered in batches of run_size, each batch is sorted by
+product ID and written to a run file as a sequence of marshal records. The runs
+are then merged lazily with heapq.merge, so only one record per run is held in
+memory. Two such sorted streams are joined in a single linear pass.
+
+Duplicate product IDs keep the last occurrence in feed order, like dict(...)
+does for the in-memory parser: a later run wins over an earlier one, and within
+a run the batch dict already kept the last value.
+"""
+import heapq
+import marshal
+import os
+
+
+def _write_run(path, batch):
+    with open(path, 'wb') as f:
+        for product_id in sorted(batch):
+            marshal.dump((product_id, batch[product_id]), f, 4)
+
+
+def write_sorted_runs(products, directory, run_size, prefix='run'):
+    """Writes (product_id, product_data) pairs to sorted run files in directory and returns their paths."""
+    run_paths = []
+    batch = {}
+    for product_id, product_data in products:
+        batch[product_id] = product_data
+        if len(batch) >= run_size:
+            path = os.path.join(directory, f"{prefix}-{len(run_paths)}")
+            _write_run(path, batch)
+            run_paths.append(path)
+            batch = {}
+    if batch or not run_paths:
+        path = os.path.join(directory, f"{prefix}-{len(run_paths)}")
+        _write_run(path, batch)
+        run_paths.append(path)
+    return run_paths
+
+
+def _iter_run(path, run_index):
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                product_id, product_data = marshal.load(f)
+            except EOFError:
+                return
+            # Negated run index: for equal IDs the latest run comes first in the merge
+            yield product_id, -run_index, product_data
+
+
+def iter_sorted_products(run_paths):
+    """Yields (product_id, product_data) in product ID order, one record per ID (last occurrence wins)."""
+    merged = heapq.merge(*(_iter_run(path, index) for index, path in enumerate(run_paths)))
+    previous_id = None
+    first = True
+    for product_id, _, product_data in merged:
+        if first or product_id != previous_id:
+            yield product_id, product_data
+            previous_id = product_id
+            first = False
+
+
+def merge_join(products1, products2):
+    """
+    Joins two streams sorted by product ID. Yields (product_id, product1, product2),
+    where the product missing from one of the feeds is None.
+    """
+    sentinel = object()
+    iter1, iter2 = iter(products1), iter(products2)
+    id1, data1 = next(iter1, (sentinel, None))
+    id2, data2 = next(iter2, (sentinel, None))
+    while id1 is not sentinel or id2 is not sentinel:
+        if id2 is sentinel or (id1 is not sentinel and id1 < id2):
+            yield id1, data1, None
+            id1, data1 = next(iter1, (sentinel, None))
+        elif id1 is sentinel or id2 < id1:
+            yield id2, None, data2
+            id2, data2 = next(iter2, (sentinel, None))
+        else:
+            yield id1, data1, data2
+            id1, data1 = next(iter1, (sentinel, None))
+            id2, data2 = next(iter2, (sentinel, None))
@@ -0,0 +1,250 @@
+"""
+On-disk cache for downloaded XML feeds.
+
+Bodies are stored content-addressed (sha256 of the bytes) in a directory shared
+by all gunicorn workers and read back through mmap, so the page cache holds a
+single copy no matter how many workers use it. Every cached URL has a small
+JSON index entry with its validators (ETag / Last-Modified) used for
+conditional GET requests.
+
+Next to the bodies the cache keeps parsed-feed snapshots: the product map
+produced by the parser, stored columnar (one attribute list per distinct
+product shape plus a value tuple per product) with marshal, keyed by the
+content hash and the parser version. Loading a snapshot is an order of
+magnitude faster than parsing the XML again.
+
+Snapshots can be accompanied by per-product fingerprints (computed once per
+feed content at parse time). The cache also keeps the state of the last
+comparison of each feed pair (fingerprints and differences) used for
+incremental re-comparison.
+
+The total size of stored bodies and snapshots is capped and the least recently
+used files are evicted first.
+"""
+import hashlib
+import json
+import marshal
+import mmap
+import os
+import tempfile
+import time
+
+
+SNAPSHOT_MAGIC = b'FCSNAP1\n'
+
+
+class CachedBlob(mmap.mmap):
+    """Read-only mmap of a cached body; path lets other processes read the same file."""
+
+
+class FeedCache:
+    """Content-addressed feed cache with LRU eviction and HTTP revalidation."""
+
+    def __init__(self, directory, max_size, ttl):
+        self.directory = directory
+        self.max_size = max_size
+        self.ttl = ttl
+        self.blobs_dir = os.path.join(directory, 'blobs')
+        self.index_dir = os.path.join(directory, 'index')
+        self.snapshots_dir = os.path.join(directory, 'snapshots')
+        self.comparisons_dir = os.path.join(directory, 'comparisons')
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        os.makedirs(self.index_dir, exist_ok=True)
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+        os.makedirs(self.comparisons_dir, exist_ok=True)
+
+    def _index_path(self, url):
+        return os.path.join(self.index_dir, hashlib.sha256(url.encode('utf-8')).hexdigest() + '.json')
+
+    def _blob_path(self, digest):
+        return os.path.join(self.blobs_dir, digest)
+
+    def _write_atomic(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def lookup(self, url):
+        """Returns the index entry for url, or None when nothing usable is cached."""
+        try:
+            with open(self._index_path(url), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(self._blob_path(entry['digest'])):
+            return None
+        return entry
+
+    def is_fresh(self, entry):
+        """Entry younger than the TTL can be served without asking the origin server."""
+        return time.time() - entry['fetched_at'] < self.ttl
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def revalidated(self, url, entry):
+        """Marks entry as fresh again after a 304 Not Modified response."""
+        entry['fetched_at'] = time.time()
+        self._write_atomic(self._index_path(url), json.dumps(entry).encode('utf-8'))
+        return entry
+
+    def open(self, entry):
+        """
+        Returns the cached body as a read-only CachedBlob mmap (bytes for empty bodies),
+        or None when the body was evicted after the lookup (treat it as a cache miss).
+        """
+        path = self._blob_path(entry['digest'])
+        try:
+            # Aktualizacja czasu dostępu na potrzeby LRU
+            os.utime(path)
+            if entry['size'] == 0:
+                return b''
+            with open(path, 'rb') as f:
+                blob = CachedBlob(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            # Inny worker usunął plik (LRU) między lookup a open
+            return None
+        blob.path = path
+        return blob
+
+    def store(self, url, chunks, max_size, etag=None, last_modified=None):
+        """
+        Writes the body from an iterable of chunks to the cache.
+        Returns the new index entry, or None when the body exceeds max_size.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.blobs_dir, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    size += len(chunk)
+                    if size > max_size:
+                        return None
+                    digest.update(chunk)
+                    f.write(chunk)
+            entry = {
+                'url': url,
+                'digest': digest.hexdigest(),
+                'size': size,
+                'etag': etag,
+                'last_modified': last_modified,
+                'fetched_at': time.time(),
+            }
+            os.replace(tmp_path, self._blob_path(entry['digest']))
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+        self._write_atomic(self._index_path(url), json.dumps(entry).encode('utf-8'))
+        self.evict(keep=self._blob_path(entry['digest']))
+        return entry
+
+    def _snapshot_path(self, key):
+        return os.path.join(self.snapshots_dir, key)
+
+    def load_snapshot(self, key, factory=None):
+        """
+        Returns the product map stored under key, or None when there is no valid snapshot.
+        factory(shapes, rows) builds the map from the stored layout; by default a dict of dicts.
+        """
+        path = self._snapshot_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            if not data.startswith(SNAPSHOT_MAGIC):
+                return None
+            shapes, rows = marshal.loads(memoryview(data)[len(SNAPSHOT_MAGIC):])
+            os.utime(path)
+        except (OSError, ValueError, EOFError, TypeError):
+            return None
+        if factory is not None:
+            return factory(shapes, rows)
+        return {product_id: dict(zip(shapes[shape], values)) for product_id, shape, values in rows}
+
+    def store_snapshot(self, key, products):
+        """Stores the product map under key (written atomically, readable by all workers)."""
+        if hasattr(products, 'to_columns'):
+            shapes, rows = products.to_columns()
+        else:
+            shapes = {}
+            rows = []
+            for product_id, product_data in products.items():
+                shape = shapes.setdefault(tuple(product_data), len(shapes))
+                rows.append((product_id, shape, tuple(product_data.values())))
+            shapes = list(shapes)
+        payload = marshal.dumps((shapes, rows), 4)
+        path = self._snapshot_path(key)
+        self._write_atomic(path, SNAPSHOT_MAGIC + payload)
+        self.evict(keep=path)
+
+    def load_fingerprints(self, key):
+        """Returns the {product_id: fingerprint} map stored next to the snapshots under key, or None."""
+        path = self._snapshot_path(f"{key}.fingerprints")
+        try:
+            with open(path, 'rb') as f:
+                fingerprints = marshal.load(f)
+            os.utime(path)
+        except (OSError, ValueError, EOFError, TypeError):
+            return None
+        return fingerprints if isinstance(fingerprints, dict) else None
+
+    def store_fingerprints(self, key, fingerprints):
+        """Stores the product fingerprints of a parsed feed under key."""
+        path = self._snapshot_path(f"{key}.fingerprints")
+        self._write_atomic(path, marshal.dumps(fingerprints, 4))
+        self.evict(keep=path)
+
+    def load_comparison_state(self, key):
+        """Returns the stored state of the previous comparison for key, or None."""
+        path = os.path.join(self.comparisons_dir, key)
+        try:
+            with open(path, 'rb') as f:
+                state = marshal.load(f)
+            os.utime(path)
+        except (OSError, ValueError, EOFError, TypeError):
+            return None
+        return state
+
+    def store_comparison_state(self, key, state):
+        """Stores the comparison state (plain dicts/lists/str/bytes) for key."""
+        path = os.path.join(self.comparisons_dir, key)
+        self._write_atomic(path, marshal.dumps(state, 4))
+        self.evict(keep=path)
+
+    def evict(self, keep=None):
+        """Removes least recently used files (except keep) until the cache fits in max_size."""
+        files = []
+        total = 0
+        for directory in (self.blobs_dir, self.snapshots_dir, self.comparisons_dir):
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                if name.startswith('.tmp-'):
+                    continue
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                total += stat.st_size
+                if path != keep:
+                    files.append((stat.st_mtime, stat.st_size, path))
+
+        for _, size, path in sorted(files):
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,209 @@
+"""
+Strumieniowy parser produktów z feedów XML.
+
+Moduł nie zależy od aplikacji Flask, więc procesy puli parsowania równoległego
+(PARSE_WORKERS > 0, uruchamiane przez forkserver) importują tylko parser,
+konfigurację i obsługę kompresji. Dwa backendy (PARSER_BACKEND) zwracają
+identyczne produkty: 'etree' (iterparse z defusedxml) i 'expat' (słowniki
+produktów budowane bezpośrednio ze zdarzeń parsera).
+"""
+import io
+from xml.parsers import expat
+
+import defusedxml.ElementTree as ET
+from defusedxml.common import EntitiesForbidden, ExternalReferenceForbidden
+
+from compression import open_feed
+from config import Config
+
+# Tagi elementów produktu i tagi identyfikatora (porównywane bez namespace, małymi literami)
+PRODUCT_TAGS = ('item', 'product', 'entry', 'offer')
+PRODUCT_ID_TAGS = ('id', 'product_id', 'sku', 'g:id')
+
+# Rozmiar bloku podawanego parserowi expat
+EXPAT_READ_SIZE = 65536
+
+
+def products_from_element(element):
+    """Zwraca pary (product_id, atrybuty) dla elementu i jego potomków (kolejność dokumentu)"""
+    for item in element.iter():
+        item_tag = item.tag.split('}', 1)[-1]
+        if item_tag.lower() in PRODUCT_TAGS:
+            product_data = {}
+            product_id = None
+            for child in item:
+                child_tag = child.tag.split('}', 1)[-1]
+                value = child.text.strip() if child.text else ''
+                if child_tag.lower() in PRODUCT_ID_TAGS:
+                    product_id = value
+                product_data[child_tag] = value
+            if product_id:
+                yield product_id, product_data
+
+
+def iter_products(xml_content, backend=None):
+    """
+    Strumieniowo zwraca pary (product_id, atrybuty). backend wybiera parser:
+    'etree' (iterparse z defusedxml) albo 'expat' (obsługa zdarzeń budująca
+    słowniki produktów bezpośrednio); domyślnie Config.PARSER_BACKEND. Oba
+    zwracają identyczne produkty w tej samej kolejności i zgłaszają
+    ET.ParseError dla błędnego XML. Przyjmuje bytes albo binarny obiekt
+    plikowy; treść gzip, bz2 i zstd jest rozpakowywana w locie (do
+    MAX_DECOMPRESSED_SIZE bajtów).
+    """
+    source = open_feed(xml_content, Config.MAX_DECOMPRESSED_SIZE)
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    if (backend or Config.PARSER_BACKEND) == 'expat':
+        return _iter_products_expat(source)
+    return _iter_products_etree(source)
+
+
+def _iter_products_etree(source):
+    """
+    Backend 'etree'. Każdy element produktu najwyższego poziomu jest zwalniany
+    zaraz po przetworzeniu, więc szczytowe zużycie pamięci zależy od jednego
+    produktu, a nie od całego drzewa.
+    """
+    open_elements = []   # stos otwartych elementów
+    consumed = []        # liczba zamkniętych dzieci per otwarty element
+    product_depth = 0
+
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        is_product = elem.tag.split('}', 1)[-1].lower() in PRODUCT_TAGS
+        if event == 'start':
+            open_elements.append(elem)
+            consumed.append(0)
+            if is_product:
+                product_depth += 1
+            continue
+
+        open_elements.pop()
+        consumed.pop()
+        if is_product:
+            product_depth -= 1
+        if product_depth:
+            # Element wewnątrz produktu - zostaje do zamknięcia produktu nadrzędnego
+            continue
+
+        if is_product:
+            yield from products_from_element(elem)
+        elem.clear()
+
+        # Usuń przetworzone dzieci z rodzica, żeby drzewo nie rosło
+        if open_elements:
+            consumed[-1] += 1
+            if consumed[-1] >= 1000:
+                del open_elements[-1][:consumed[-1]]
+                consumed[-1] = 0
+
+
+def _iter_products_expat(source):
+    """
+    Backend 'expat': słowniki produktów powstają bezpośrednio ze zdarzeń
+    początku/końca elementu i tekstu, bez tworzenia obiektów Element. Jak
+    w defusedxml, deklaracje encji i odwołania do encji zewnętrznych są
+    odrzucane.
+    """
+    parser = expat.ParserCreate(namespace_separator='}')
+    parser.buffer_text = True
+    parser.buffer_size = EXPAT_READ_SIZE
+    products = []   # produkty gotowe do oddania po bieżącym bloku
+    frames = []     # otwarte produkty: [głębokość, atrybuty, id, tag bieżącego dziecka, tekst dziecka]
+    pending = []    # produkty bieżącego produktu najwyższego poziomu w kolejności dokumentu
+    depth = 0
+    text = None     # fragmenty tekstu dziecka produktu (tylko przed jego pierwszym podelementem)
+
+    def start(name, attrs):
+        nonlocal depth, text
+        depth += 1
+        text = None
+        tag = name.split('}', 1)[-1]
+        if frames and frames[-1][0] == depth - 1:
+            frame = frames[-1]
+            frame[3] = tag
+            text = frame[4] = []
+        if tag.lower() in PRODUCT_TAGS:
+            frame = [depth, {}, None, None, None]
+            frames.append(frame)
+            pending.append(frame)
+
+    def end(name):
+        nonlocal depth, text
+        text = None
+        if frames and frames[-1][0] == depth:
+            frames.pop()
+            if not frames:
+                products.extend((frame[2], frame[1]) for frame in pending if frame[2])
+                pending.clear()
+        if frames and frames[-1][0] == depth - 1:
+            frame = frames[-1]
+            value = ''.join(frame[4]).strip()
+            if frame[3].lower() in PRODUCT_ID_TAGS:
+                frame[2] = value
+            frame[1][frame[3]] = value
+        depth -= 1
+
+    def characters(data):
+        if text is not None:
+            text.append(data)
+
+    def forbid_entity(name, is_parameter_entity, value, base, system_id, public_id, notation_name):
+        raise EntitiesForbidden(name, value, base, system_id, public_id, notation_name)
+
+    def forbid_unparsed_entity(name, base, system_id, public_id, notation_name):
+        raise EntitiesForbidden(name, None, base, system_id, public_id, notation_name)
+
+    def forbid_external(context, base, system_id, public_id):
+        raise ExternalReferenceForbidden(context, base, system_id, public_id)
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = characters
+    parser.EntityDeclHandler = forbid_entity
+    parser.UnparsedEntityDeclHandler = forbid_unparsed_entity
+    parser.ExternalEntityRefHandler = forbid_external
+
+    while True:
+        block = source.read(EXPAT_READ_SIZE)
+        try:
+            parser.Parse(block, not block)
+        except expat.ExpatError as e:
+            # Ten sam wyjątek co przy 'etree' - obsługa błędów (np. powrót do parsowania szeregowego) działa bez zmian
+            error = ET.ParseError(str(e))
+            error.code, error.position = e.code, (e.lineno, e.offset)
+            raise error from None
+        if products:
+            yield from products
+            products.clear()
+        if not block:
+            return
+
+
+def parse_shard(xml_content):
+    """
+    Parsuje jeden shard w procesie puli; zwraca słownik produktów. Wyjątek wraca do
+    procesu nadrzędnego przez pickle, a nie każdy da się odtworzyć (np. EntitiesForbidden
+    wymaga 6 argumentów) - nieodtworzalny wyjątek psuje całą pulę. Dlatego błąd XML
+    wraca jako ET.ParseError, a każdy inny jako ValueError z treścią komunikatu.
+    """
+    try:
+        return dict(iter_products(xml_content))
+    except ET.ParseError as e:
+        raise ET.ParseError(str(e)) from None
+    except Exception as e:
+        raise ValueError(f"{type(e).__name__}: {e}") from None
+
+
+def parse_file_shard(path, ranges):
+    """
+    Parsuje shard opisany zakresami bajtów (offset, długość) pliku feedu - proces
+    nadrzędny przekazuje tylko ścieżkę i zakresy zamiast kopii treści. Plik usunięty
+    w międzyczasie (np. wyparty z cache) zgłasza OSError.
+    """
+    parts = []
+    with open(path, 'rb') as f:
+        for offset, length in ranges:
+            f.seek(offset)
+            parts.append(f.read(length))
+    return parse_shard(b''.join(parts))
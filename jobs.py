@@ -0,0 +1,195 @@
+"""
+Background jobs for long-running comparisons.
+
+Job state is kept in JOBS_DIR as one JSON file per job, so the status and the
+stored result can be served by any gunicorn worker, not only by the one that
+runs the job. Work runs on a bounded thread pool inside the worker that
+accepted the submission; the request returns immediately with the job id.
+
+Submissions with the same key (feed pair + exclusions) are coalesced: while a
+job for the key is queued or running, submitting again returns its id instead
+of starting a second comparison. The id of the newest successfully finished job
+of every key is kept as well (latest_done), so a precomputed result stays
+available while a refresh of it is running.
+"""
+import fcntl
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+# Minimalny odstęp (s) między zapisami postępu tego samego etapu
+PROGRESS_WRITE_INTERVAL = 0.5
+
+
+class JobContext:
+    """Handle passed to the job function: progress reporting and the result location."""
+
+    def __init__(self, manager, job_id):
+        self.manager = manager
+        self.job_id = job_id
+        self.result_path = manager.result_path(job_id)
+        self._stage = None
+        self._last_write = 0.0
+
+    def progress(self, stage, done=None, total=None):
+        """Reports the current stage and, optionally, how many of total items are processed."""
+        now = time.time()
+        if stage == self._stage and now - self._last_write < PROGRESS_WRITE_INTERVAL and done != total:
+            return
+        self._stage = stage
+        self._last_write = now
+        percent = round(done / total * 100, 1) if done is not None and total else None
+        self.manager._update(self.job_id, stage=stage, done=done, total=total, percent=percent)
+
+
+class JobManager:
+    """Runs job functions on a bounded pool and persists their state on disk."""
+
+    def __init__(self, directory, max_workers, result_ttl):
+        self.directory = directory
+        self.keys_dir = os.path.join(directory, 'keys')
+        self.max_workers = max_workers
+        self.result_ttl = result_ttl
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        os.makedirs(self.keys_dir, exist_ok=True)
+
+    def _status_path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def result_path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.result")
+
+    def _write_status(self, job_id, status):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(status, f)
+        os.replace(tmp_path, self._status_path(job_id))
+
+    def _update(self, job_id, **fields):
+        status = self.status(job_id)
+        if status is None:
+            return
+        status.update(fields, updated_at=time.time())
+        self._write_status(job_id, status)
+
+    def status(self, job_id):
+        """Returns the stored job state, or None for unknown ids."""
+        if not job_id or not all(c in '0123456789abcdef' for c in job_id):
+            return None
+        try:
+            with open(self._status_path(job_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _is_alive(self, status):
+        """Active job whose owning worker process no longer exists is treated as lost."""
+        if status['status'] not in ACTIVE_STATUSES:
+            return False
+        try:
+            os.kill(status['pid'], 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def submit(self, key, params, fn, *args):
+        """
+        Starts fn(job_context, *args) in the background and returns the job id.
+        fn returns None on success or an error message. If a job with the same
+        key is still active, its id is returned and nothing new is started.
+        """
+        key_path = os.path.join(self.keys_dir, key)
+        with open(key_path + '.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with open(key_path, 'r', encoding='utf-8') as f:
+                    existing = self.status(f.read().strip())
+            except OSError:
+                existing = None
+            if existing and self._is_alive(existing):
+                return existing['id']
+
+            job_id = uuid.uuid4().hex
+            now = time.time()
+            self._write_status(job_id, {
+                'id': job_id,
+                'key': key,
+                'params': params,
+                'status': 'queued',
+                'stage': 'queued',
+                'done': None,
+                'total': None,
+                'percent': None,
+                'error': None,
+                'pid': os.getpid(),
+                'created_at': now,
+                'updated_at': now,
+                'finished_at': None,
+            })
+            with open(key_path, 'w', encoding='utf-8') as f:
+                f.write(job_id)
+
+        # Wątkowe workery gunicorna (gthread) zlecają zadania z kilku wątków naraz
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='job')
+        self._executor.submit(self._run, job_id, fn, args)
+        self.cleanup()
+        return job_id
+
+    def _run(self, job_id, fn, args):
+        self._update(job_id, status='running', stage='start')
+        try:
+            error = fn(JobContext(self, job_id), *args)
+        except Exception as e:
+            traceback.print_exc()
+            error = f"Nieoczekiwany błąd: {str(e)}"
+        if error:
+            self._update(job_id, status='error', stage='error', error=error, finished_at=time.time())
+        else:
+            self._update(job_id, status='done', stage='done', finished_at=time.time())
+            status = self.status(job_id)
+            fd, tmp_path = tempfile.mkstemp(dir=self.keys_dir, prefix='.tmp-')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(job_id)
+            os.replace(tmp_path, os.path.join(self.keys_dir, f"{status['key']}.done"))
+
+    def latest_done(self, key):
+        """Returns the state of the newest successfully finished job for key, or None."""
+        try:
+            with open(os.path.join(self.keys_dir, f"{key}.done"), 'r', encoding='utf-8') as f:
+                status = self.status(f.read().strip())
+        except OSError:
+            return None
+        if status is None or status['status'] != 'done' or not os.path.exists(self.result_path(status['id'])):
+            return None
+        return status
+
+    def cleanup(self):
+        """Removes finished jobs (state and result files) older than result_ttl."""
+        cutoff = time.time() - self.result_ttl
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            status = self.status(name[:-len('.json')])
+            if status is None or status['status'] in ACTIVE_STATUSES:
+                continue
+            if (status['finished_at'] or status['updated_at']) < cutoff:
+                # Wynik N-way ma obok pliku wyniku pliki wyników feedów docelowych (<id>.result.<n>)
+                result_paths = glob.glob(glob.escape(self.result_path(status['id'])) + '*')
+                for path in result_paths + [self._status_path(status['id'])]:
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass
@@ -0,0 +1,265 @@
+"""
+Stage timings, counters and the Prometheus text exposition for /metrics.
+
+Every process keeps its own values and writes them to METRICS_DIR as one JSON
+file per pid after each update, so /metrics served by any gunicorn worker
+reports the sum over all workers (like the multiprocess mode of
+prometheus_client, without the dependency). Counters and summaries are summed,
+'max' gauges report the maximum over processes.
+
+Each stage (validate, download, parse, diff, render, excel, ...) is timed with
+the stage() context manager, which also logs one structured line per stage:
+
+    with metrics.stage('download', source=url) as info:
+        ...
+        info['bytes'] = size
+
+Code running as part of a background job does so inside JobRun.thread(): stage
+lines then carry the job id, the job's cProfile profile covers the thread and
+the job's resident memory is sampled at every stage boundary. Worker threads
+started by the job join it through in_job().
+"""
+import contextvars
+import cProfile
+import json
+import logging
+import os
+import pstats
+import resource
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger('feedcompare')
+
+# Nazwa metryki -> (typ Prometheus, opis); typ 'max' to gauge agregowany maksimum
+METRICS = {
+    'feedcompare_stage_seconds': ('summary', 'Time spent in a comparison stage.'),
+    'feedcompare_download_bytes_total': ('counter', 'Bytes of feed content downloaded or read from cache.'),
+    'feedcompare_parsed_products_total': ('counter', 'Products parsed (or loaded from snapshots).'),
+    'feedcompare_differences_total': ('counter', 'Attribute differences found.'),
+    'feedcompare_cache_requests_total': ('counter', 'Feed and snapshot cache lookups by result.'),
+    'feedcompare_comparisons_total': ('counter', 'Finished comparison jobs by status.'),
+    'feedcompare_comparison_peak_rss_bytes': ('summary', 'Peak resident memory (high-water mark) of the process at the end of a comparison.'),
+    'feedcompare_comparison_peak_rss_bytes_max': ('max', 'Largest peak resident memory of the process at the end of a comparison.'),
+    'feedcompare_comparison_rss_growth_bytes': ('summary', 'Resident memory growth during a comparison, sampled at stage boundaries.'),
+}
+
+# Zadanie, którego kod wykonuje bieżący wątek (JobRun albo None)
+_current_job = contextvars.ContextVar('feedcompare_job', default=None)
+
+
+def _label_key(labels):
+    return json.dumps(sorted(labels.items()))
+
+
+def _format_labels(label_key, extra=None):
+    labels = json.loads(label_key) + (extra or [])
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+def reset_peak_rss():
+    """Resets the kernel's peak RSS counter of this process (Linux); returns False when unsupported."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss():
+    """Peak resident memory of this process in bytes (VmHWM, or ru_maxrss without /proc)."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def current_rss():
+    """Current resident memory of this process in bytes (VmRSS); None without /proc."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class JobRun:
+    """
+    Instrumentation state of one running job: its id, the cProfile profiles of
+    every thread that ran its code and resident memory samples. The peak RSS
+    counter of the kernel is shared by the whole process, so it is never reset
+    per job - rss_growth() is the job's own estimate.
+    """
+
+    def __init__(self, job_id, profile=False):
+        self.job_id = job_id
+        self.profiles = [] if profile else None
+        self.rss_start = current_rss()
+        self.rss_peak = self.rss_start
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def thread(self):
+        """Runs the code of the calling thread as part of this job."""
+        token = _current_job.set(self)
+        profiler = None
+        if self.profiles is not None:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Python 3.12+: aktywny profiler (np. innego wątku tego zadania) obejmuje już wszystkie wątki
+                profiler = None
+        try:
+            yield self
+        finally:
+            if profiler:
+                profiler.disable()
+                with self._lock:
+                    self.profiles.append(profiler)
+            _current_job.reset(token)
+
+    def sample_rss(self):
+        rss = current_rss()
+        if rss is not None:
+            with self._lock:
+                self.rss_peak = max(self.rss_peak or 0, rss)
+
+    def rss_growth(self):
+        """Largest sampled resident memory minus the resident memory at the start of the job."""
+        self.sample_rss()
+        if self.rss_start is None:
+            return None
+        return max(self.rss_peak - self.rss_start, 0)
+
+    def dump_stats(self, path):
+        """Writes the merged profile of all threads of the job; False when nothing was profiled."""
+        if not self.profiles:
+            return False
+        stats = pstats.Stats(self.profiles[0])
+        for profiler in self.profiles[1:]:
+            stats.add(profiler)
+        stats.dump_stats(path)
+        return True
+
+
+def in_job(fn):
+    """
+    Binds fn to the job of the calling thread, for callables handed to worker
+    threads: executor.map(in_job(self._load_feed), sources).
+    """
+    run = _current_job.get()
+    if run is None:
+        return fn
+
+    def run_in_job(*args, **kwargs):
+        with run.thread():
+            return fn(*args, **kwargs)
+    return run_in_job
+
+
+class Metrics:
+    """Process-local metric values persisted for aggregation across workers."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._values = {}   # (nazwa, klucz etykiet) -> wartość; dla summary [suma, liczba]
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _persist(self):
+        path = os.path.join(self.directory, f"metrics-{os.getpid()}.json")
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump([[name, labels, value] for (name, labels), value in self._values.items()], f)
+        os.replace(tmp_path, path)
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            key = (name, _label_key(labels))
+            self._values[key] = self._values.get(key, 0) + value
+            self._persist()
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            key = (name, _label_key(labels))
+            total, count = self._values.get(key, (0, 0))
+            self._values[key] = (total + value, count + 1)
+            if f"{name}_max" in METRICS:
+                max_key = (f"{name}_max", key[1])
+                self._values[max_key] = max(self._values.get(max_key, 0), value)
+            self._persist()
+
+    @contextmanager
+    def stage(self, name, **context):
+        """
+        Times a stage and logs it. The yielded dict collects stage details:
+        'bytes' and 'products' are also added to the throughput counters.
+        """
+        info = {}
+        started = time.perf_counter()
+        try:
+            yield info
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe('feedcompare_stage_seconds', elapsed, stage=name)
+            details = ''
+            if 'bytes' in info:
+                self.inc('feedcompare_download_bytes_total', info['bytes'])
+                details += f" bytes={info['bytes']} mb_per_s={info['bytes'] / 1048576 / elapsed if elapsed else 0:.1f}"
+            if 'products' in info:
+                self.inc('feedcompare_parsed_products_total', info['products'])
+                details += f" products={info['products']} products_per_s={info['products'] / elapsed if elapsed else 0:.0f}"
+            details += ''.join(f" {key}={value}" for key, value in info.items() if key not in ('bytes', 'products'))
+            details += ''.join(f" {key}={value}" for key, value in context.items())
+            run = _current_job.get()
+            if run is not None:
+                run.sample_rss()
+            logger.info(f"{f'job={run.job_id} ' if run is not None else ''}stage={name} seconds={elapsed:.3f}{details}")
+
+    def render(self):
+        """Prometheus text exposition of the values of all processes."""
+        totals = {}
+        for file_name in os.listdir(self.directory):
+            if not (file_name.startswith('metrics-') and file_name.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(self.directory, file_name), 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, labels, value in entries:
+                key = (name, labels)
+                if METRICS.get(name, ('counter',))[0] == 'max':
+                    totals[key] = max(totals.get(key, 0), value)
+                elif isinstance(value, list):
+                    total, count = totals.get(key, (0, 0))
+                    totals[key] = (total + value[0], count + value[1])
+                else:
+                    totals[key] = totals.get(key, 0) + value
+
+        lines = []
+        for name, (kind, description) in METRICS.items():
+            entries = sorted((labels, value) for (metric, labels), value in totals.items() if metric == name)
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {'gauge' if kind == 'max' else kind}")
+            for labels, value in entries:
+                if kind == 'summary':
+                    lines.append(f"{name}_sum{_format_labels(labels)} {value[0]}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {value[1]}")
+                else:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,140 @@
+"""
+Compact in-memory representation of a parsed feed.
+
+A plain {product_id: {attribute: value}} map spends most of its memory on the
+per-product dicts, which all repeat the same few dozen attribute names. The
+ProductStore keeps every distinct attribute layout (shape) once and stores a
+product as a tuple (shape index, value1, value2, ...). Values of low-cardinality
+attributes (currency, availability, brand, condition, ...) are interned, so
+equal values share one string object.
+
+The store and its records are read-only Mappings, so code written for the
+dict-of-dicts representation (find_differences, fingerprints, attribute lists)
+works with both.
+"""
+from collections.abc import Mapping
+
+# Wartości atrybutu są internowane, dopóki ma on najwyżej tyle różnych wartości
+INTERN_LIMIT = 1024
+
+
+class ProductRecord(Mapping):
+    """Read-only view of one product: attribute names come from the shared shape."""
+
+    __slots__ = ('_shape', '_row')
+
+    def __init__(self, shape, row):
+        self._shape = shape
+        self._row = row
+
+    def __getitem__(self, key):
+        return self._row[self._shape[1][key]]
+
+    def get(self, key, default=None):
+        position = self._shape[1].get(key)
+        return default if position is None else self._row[position]
+
+    def __contains__(self, key):
+        return key in self._shape[1]
+
+    def __iter__(self):
+        return iter(self._shape[0])
+
+    def __len__(self):
+        return len(self._shape[0])
+
+    def keys(self):
+        return self._shape[1].keys()
+
+    def values(self):
+        return self._row[1:]
+
+    def items(self):
+        return zip(self._shape[0], self._row[1:])
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class ProductStore(Mapping):
+    """Map of product ID -> ProductRecord with shared shapes and interned values."""
+
+    def __init__(self, items=()):
+        self._shapes = []      # (nazwy atrybutów, {nazwa: pozycja w wierszu})
+        self._shape_ids = {}   # nazwy atrybutów -> indeks w _shapes
+        self._rows = {}        # product_id -> (indeks kształtu, wartość, ...)
+        self._interned = {}    # nazwa atrybutu -> {wartość: wartość} albo None po przekroczeniu limitu
+        self.update(items)
+
+    def _shape_id(self, names):
+        shape_id = self._shape_ids.get(names)
+        if shape_id is None:
+            shape_id = self._shape_ids[names] = len(self._shapes)
+            self._shapes.append((names, {name: position for position, name in enumerate(names, 1)}))
+        return shape_id
+
+    def _intern(self, name, value):
+        table = self._interned.get(name, {})
+        if table is None:
+            return value
+        interned = table.get(value)
+        if interned is not None:
+            return interned
+        if len(table) >= INTERN_LIMIT:
+            # Atrybut o wysokiej kardynalności (ID, tytuł, URL) - internowanie tylko kosztuje pamięć
+            self._interned[name] = None
+            return value
+        table[value] = value
+        self._interned[name] = table
+        return value
+
+    def add(self, product_id, product_data):
+        """Adds or replaces a product (like dict assignment, a replaced ID keeps its position)."""
+        names = tuple(product_data)
+        intern = self._intern
+        self._rows[product_id] = (self._shape_id(names),) + tuple(
+            intern(name, value) for name, value in zip(names, product_data.values())
+        )
+
+    def update(self, items):
+        """Adds products from a mapping or an iterable of (product_id, product_data) pairs."""
+        if isinstance(items, Mapping):
+            items = items.items()
+        for product_id, product_data in items:
+            self.add(product_id, product_data)
+
+    def __getitem__(self, product_id):
+        row = self._rows[product_id]
+        return ProductRecord(self._shapes[row[0]], row)
+
+    def __contains__(self, product_id):
+        return product_id in self._rows
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def keys(self):
+        return self._rows.keys()
+
+    def to_columns(self):
+        """Returns (shapes, rows) with rows as (product_id, shape index, values) - the snapshot layout."""
+        return (
+            [names for names, _ in self._shapes],
+            [(product_id, row[0], row[1:]) for product_id, row in self._rows.items()],
+        )
+
+    @classmethod
+    def from_columns(cls, shapes, rows):
+        """Builds a store from the (shapes, rows) layout returned by to_columns."""
+        store = cls()
+        shape_ids = [store._shape_id(tuple(names)) for names in shapes]
+        intern = store._intern
+        for product_id, shape, values in rows:
+            names = store._shapes[shape_ids[shape]][0]
+            store._rows[product_id] = (shape_ids[shape],) + tuple(
+                intern(name, value) for name, value in zip(names, values)
+            )
+        return store
@@ -0,0 +1,226 @@
+"""
+Persistent storage for finished comparison results.
+
+Each result is a single SQLite file, so it can be written by the worker that
+ran the comparison and read by any other gunicorn worker. Rows keep the order
+produced by compare_feeds (only-in lists and differences sorted by product ID).
+
+Differences are indexed per attribute (attribute, product_id) and by product
+ID, so pages filtered by attribute or product ID prefix are read straight from
+the index instead of loading the whole result.
+
+An N-way result (one baseline against many targets) keeps the difference
+matrix and the list of targets in its own file; the result of each target is
+an ordinary pair result stored next to it (target_result_path).
+"""
+import json
+import os
+import sqlite3
+
+SUMMARY_FIELDS = ('total_feed1', 'total_feed2', 'common_total', 'diff_products_total', 'attribute_stats')
+
+SORT_COLUMNS = {
+    'product': ('product_id', 'attribute'),
+    'attribute': ('attribute', 'product_id'),
+}
+
+
+def save_results(path, results):
+    """Writes a compare_feeds result to path (atomically replaces an existing file)."""
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    if os.path.exists(tmp_path):
+        os.unlink(tmp_path)
+    connection = sqlite3.connect(tmp_path)
+    try:
+        connection.executescript('''
+            CREATE TABLE summary (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE only_in (feed INTEGER NOT NULL, product_id TEXT NOT NULL);
+            CREATE TABLE differences (
+                product_id TEXT NOT NULL,
+                attribute TEXT NOT NULL,
+                value1 TEXT NOT NULL,
+                value2 TEXT NOT NULL
+            );
+        ''')
+        connection.executemany(
+            'INSERT INTO summary (key, value) VALUES (?, ?)',
+            [(field, json.dumps(results[field])) for field in SUMMARY_FIELDS]
+        )
+        for feed in (1, 2):
+            connection.executemany(
+                'INSERT INTO only_in (feed, product_id) VALUES (?, ?)',
+                ((feed, product_id) for product_id in results[f'only_in_feed{feed}'])
+            )
+        connection.executemany(
+            'INSERT INTO differences (product_id, attribute, value1, value2) VALUES (?, ?, ?, ?)',
+            ((d['Product ID'], d['Pole'], d['Wartość Feed 1'], d['Wartość Feed 2']) for d in results['differences'])
+        )
+        connection.executescript('''
+            CREATE INDEX differences_by_attribute ON differences (attribute, product_id);
+            CREATE INDEX differences_by_product ON differences (product_id, attribute);
+        ''')
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(tmp_path, path)
+
+
+def load_summary(path):
+    """Reads only the summary of a stored result (counts and attribute_stats), without the rows."""
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        summary = {key: json.loads(value) for key, value in connection.execute('SELECT key, value FROM summary')}
+        for feed in (1, 2):
+            summary[f'only_in_feed{feed}_total'] = connection.execute(
+                'SELECT COUNT(*) FROM only_in WHERE feed = ?', (feed,)
+            ).fetchone()[0]
+        summary['differences_total'] = connection.execute('SELECT COUNT(*) FROM differences').fetchone()[0]
+        return summary
+    finally:
+        connection.close()
+
+
+def _prefix_upper_bound(prefix):
+    """Smallest string greater than every string starting with prefix."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def query_differences(path, attributes=None, product_prefix=None, sort='product', descending=False, offset=0, limit=100):
+    """
+    Returns (total, rows) for one page of stored differences.
+    attributes limits rows to the given attribute names, product_prefix to
+    product IDs starting with the prefix; sort is a key of SORT_COLUMNS.
+    """
+    conditions = []
+    params = []
+    if attributes is not None:
+        conditions.append(f"attribute IN ({', '.join('?' * len(attributes))})")
+        params.extend(attributes)
+    if product_prefix and ord(product_prefix[-1]) < 0xD7FF:
+        conditions.append('product_id >= ? AND product_id < ?')
+        params.extend([product_prefix, _prefix_upper_bound(product_prefix)])
+    elif product_prefix:
+        conditions.append('substr(product_id, 1, ?) = ?')
+        params.extend([len(product_prefix), product_prefix])
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    direction = 'DESC' if descending else 'ASC'
+    order_by = ', '.join(f"{column} {direction}" for column in SORT_COLUMNS[sort])
+
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        total = connection.execute(f'SELECT COUNT(*) FROM differences {where}', params).fetchone()[0]
+        rows = [
+            {'Product ID': product_id, 'Pole': attribute, 'Wartość Feed 1': value1, 'Wartość Feed 2': value2}
+            for product_id, attribute, value1, value2 in connection.execute(
+                f'SELECT product_id, attribute, value1, value2 FROM differences {where} '
+                f'ORDER BY {order_by} LIMIT ? OFFSET ?',
+                params + [limit, offset]
+            )
+        ]
+        return total, rows
+    finally:
+        connection.close()
+
+
+class StoredResult:
+    """Read-only view of a stored result that streams rows instead of loading them all."""
+
+    def __init__(self, path):
+        self.path = path
+        self.summary = load_summary(path)
+
+    def _iter_rows(self, query, params=()):
+        connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        try:
+            yield from connection.execute(query, params)
+        finally:
+            connection.close()
+
+    def iter_only_in(self, feed):
+        """Yields product IDs present only in the given feed (1 or 2), sorted."""
+        for (product_id,) in self._iter_rows('SELECT product_id FROM only_in WHERE feed = ? ORDER BY rowid', (feed,)):
+            yield product_id
+
+    def iter_differences(self):
+        """Yields (product_id, attribute, value1, value2) tuples sorted by product ID and attribute."""
+        return self._iter_rows('SELECT product_id, attribute, value1, value2 FROM differences ORDER BY rowid')
+
+
+def target_result_path(path, index):
+    """Path of the pair result of target number index (from 1) of an N-way result stored at path."""
+    return f"{path}.{index}"
+
+
+def save_multi_results(path, results):
+    """Writes a MultiFeedComparator result: every target's pair result, then the matrix and summary."""
+    for index, entry in enumerate(results['targets'], 1):
+        if entry['result'] is not None:
+            save_results(target_result_path(path, index), entry['result'])
+
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    if os.path.exists(tmp_path):
+        os.unlink(tmp_path)
+    connection = sqlite3.connect(tmp_path)
+    try:
+        connection.executescript('''
+            CREATE TABLE summary (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE matrix (product_id TEXT NOT NULL, cells TEXT NOT NULL);
+        ''')
+        targets = [{'feed': entry['feed'], 'error': entry['error']} for entry in results['targets']]
+        connection.executemany(
+            'INSERT INTO summary (key, value) VALUES (?, ?)',
+            [('baseline', json.dumps(results['baseline'])), ('total_baseline', json.dumps(results['total_baseline'])),
+             ('targets', json.dumps(targets))]
+        )
+        connection.executemany(
+            'INSERT INTO matrix (product_id, cells) VALUES (?, ?)',
+            ((product_id, json.dumps(cells, ensure_ascii=False)) for product_id, cells in results['matrix'])
+        )
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(tmp_path, path)
+
+
+def load_multi_summary(path):
+    """
+    Reads the summary of an N-way result: baseline, total_baseline, matrix_total and
+    targets as a list of {'feed', 'error', 'summary'} (load_summary of the target, None on error).
+    """
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        summary = {key: json.loads(value) for key, value in connection.execute('SELECT key, value FROM summary')}
+        summary['matrix_total'] = connection.execute('SELECT COUNT(*) FROM matrix').fetchone()[0]
+    finally:
+        connection.close()
+    for index, target in enumerate(summary['targets'], 1):
+        target['summary'] = None if target['error'] else load_summary(target_result_path(path, index))
+    return summary
+
+
+class StoredMultiResult:
+    """Read-only view of a stored N-way result; target(index) returns a StoredResult."""
+
+    def __init__(self, path):
+        self.path = path
+        self.summary = load_multi_summary(path)
+
+    def iter_matrix(self, limit=None):
+        """Yields (product_id, cells) sorted by product ID, at most limit rows."""
+        connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        try:
+            query = 'SELECT product_id, cells FROM matrix ORDER BY rowid'
+            params = ()
+            if limit is not None:
+                query += ' LIMIT ?'
+                params = (limit,)
+            for product_id, cells in connection.execute(query, params):
+                yield product_id, json.loads(cells)
+        finally:
+            connection.close()
+
+    def target(self, index):
+        """Pair result of target number index (from 1), or None when that target failed."""
+        if self.summary['targets'][index - 1]['error']:
+            return None
+        return StoredResult(target_result_path(self.path, index))
@@ -0,0 +1,102 @@
+"""
+Scheduled, pre-warmed comparisons of registered feed pairs.
+
+Pairs are registered in a JSON file (SCHEDULED_COMPARISONS_FILE):
+
+    [
+        {"feed1": "https://shop.example.com/feed.xml",
+         "feed2": "https://marketplace.example.com/export.xml",
+         "excluded_attributes": ["link", "image_link"]}
+    ]
+
+A daemon thread submits a comparison for every pair whose last finished result
+is older than the interval. Every gunicorn worker starts the thread, but only
+the one holding an exclusive fcntl lock on lock_path schedules anything; when
+that worker exits, another one takes over. Comparisons run on their own
+bounded job pool, so at most SCHEDULER_WORKERS of them run at a time next to
+interactive requests.
+"""
+import fcntl
+import json
+import threading
+import time
+
+# Najdłuższa przerwa między sprawdzeniami, które pary wymagają odświeżenia (s)
+MAX_TICK = 60
+
+
+def load_scheduled_pairs(path):
+    """
+    Reads registered pairs as a list of {'feed1', 'feed2', 'excluded_attributes'}.
+    Returns an empty list when path is empty; an unreadable or invalid file is
+    reported and ignored.
+    """
+    if not path:
+        return []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        return [
+            {
+                'feed1': entry['feed1'],
+                'feed2': entry['feed2'],
+                'excluded_attributes': sorted(entry.get('excluded_attributes', [])),
+            }
+            for entry in entries
+        ]
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"⚠️  Nie udało się wczytać zaplanowanych porównań z {path}: {e}")
+        return []
+
+
+class ComparisonScheduler:
+    """
+    Background loop refreshing registered pairs. submit(pair) starts a comparison
+    (and may coalesce with one already running); last_finished(pair) returns the
+    finish time of the newest stored result or None.
+    """
+
+    def __init__(self, pairs, interval, lock_path, submit, last_finished):
+        self.pairs = pairs
+        self.interval = interval
+        self.lock_path = lock_path
+        self.submit = submit
+        self.last_finished = last_finished
+        self._submitted_at = {}   # indeks pary -> czas ostatniego zlecenia
+        self._lock_file = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is None and self.pairs:
+            self._thread = threading.Thread(target=self._loop, name='scheduler', daemon=True)
+            self._thread.start()
+
+    def _is_leader(self):
+        """Takes the scheduler lock without waiting; the lock is held until the process exits."""
+        if self._lock_file is None:
+            lock_file = open(self.lock_path, 'w')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            self._lock_file = lock_file
+        return True
+
+    def _loop(self):
+        while True:
+            try:
+                if self._is_leader():
+                    self.run_due()
+            except Exception as e:
+                print(f"Błąd harmonogramu porównań: {e}")
+            time.sleep(min(self.interval, MAX_TICK))
+
+    def run_due(self, now=None):
+        """Submits every pair whose result (or last submission) is older than the interval."""
+        now = time.time() if now is None else now
+        for index, pair in enumerate(self.pairs):
+            last = max(self.last_finished(pair) or 0, self._submitted_at.get(index, 0))
+            if now - last >= self.interval:
+                self._submitted_at[index] = now
+                self.submit(pair)